@@ -0,0 +1,79 @@
+"""Parse time and peak memory of the item shop scraper, before and after the strained parser.
+
+Run from the repository root:
+
+    python -m benchmarks.sales_parse [fixture.html ...]
+
+Every fixture defaults to the saved pages in benchmarks/fixtures.
+"""
+import re
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from util.sales import PARSER, parse_sales
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+
+def parse_sales_old(html: str) -> dict:
+    """The extraction of the daily and weekly commands before the sales catalog."""
+    soup = BeautifulSoup(html, 'html.parser')
+    data = {}
+    for section, index in (('weekly', 0), ('daily', 1)):
+        sale = soup.find_all(class_='sale__items')[index]
+        if section == 'daily':
+            date = sale.find_previous_sibling(class_='row').h2.text
+            title = datetime.strptime(date + ' ' + str(datetime.utcnow().year), '%d %b %Y').strftime('%B %d, %Y')
+            images = sale.find_all('img', class_='col')
+        else:
+            title = 'Weekly Sale'
+            images = sale.find_all('img')
+
+        texts = [item.parent.text.replace('\n', ' ').strip() for item in sale.find_all('strong')]
+        prices, items = [], []
+        for text in texts:
+            match = re.search(r'\([0-9]+v\)', text).group(0)
+            prices.append(int(re.search('[0-9]+', match).group(0)))
+            items.append(text.replace(match, '').strip())
+        data[section] = (title, items, prices, ['https://stormshield.one' + image['src'] for image in images])
+    return data
+
+
+def parse_sales_new(html: str) -> dict:
+    return {section: (sale.title, [item.name for item in sale.items], [item.price for item in sale.items],
+                      [item.image for item in sale.items])
+            for section, sale in parse_sales(html).items()}
+
+
+def measure(parse, html: str, number: int):
+    seconds = min(timeit.repeat(lambda: parse(html), number=number, repeat=5)) / number
+    tracemalloc.start()
+    parse(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds * 1000, peak / 1024
+
+
+def main(paths):
+    print(f'Backend: {PARSER}')
+    for path in paths:
+        html = Path(path).read_text(encoding='utf-8')
+        if parse_sales_old(html) != parse_sales_new(html):
+            sys.exit(f'{path}: the parsers disagree')
+
+        print(f'\n{Path(path).name} ({len(html) / 1024:.0f} KiB)')
+        results = {}
+        for name, parse in (('old', parse_sales_old), ('new', parse_sales_new)):
+            results[name] = measure(parse, html, number=10)
+            print(f'  {name}: {results[name][0]:8.2f} ms {results[name][1]:10.0f} KiB peak')
+        print(f'  speedup {results["old"][0] / results["new"][0]:.1f}x, '
+              f'memory {results["old"][1] / results["new"][1]:.1f}x less')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or sorted(FIXTURES.glob('*.html')))
@@ -12,31 +12,24 @@ from logging.handlers import RotatingFileHandler
 import discord
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from discord.ext import commands
-from peewee import SqliteDatabase
 from pytz import timezone
 
 from util import context
-
-fortnite_db = SqliteDatabase('data/fortnite.db')
+from util.database import fortnite_db
+from util.executor import DatabaseExecutor
+from util.http import HTTPClient
+from util.prefix import PrefixMatcher
+from util.ratelimit import Busy
 
 
 async def get_prefix(client, message):
-    prefixes = [client.prefix]
-    if isinstance(message.channel, discord.abc.PrivateChannel):
-        return commands.when_mentioned_or(*prefixes)(bot, message)
-    db = client.get_cog('Database')
-    guild_prefix = db.get_setting(message.guild.id, 'prefix')
-    if guild_prefix.count('|'):
-        prefixes = guild_prefix.split('|')
-    else:
-        prefixes = [guild_prefix]
-    return commands.when_mentioned_or(*prefixes)(bot, message)
+    return list((await client.prefix_matcher(message)).prefixes)
 
 
 class Bot(commands.AutoShardedBot):
     def __init__(self, *args, **kwargs):
         self.logger = set_logger()
-        self.config = configparser.ConfigParser()
+        self.config = configparser.ConfigParser(inline_comment_prefixes=(';',))
         self.config.read('config/config.ini')
         self.db = fortnite_db
         self.version = self.config['core']['version']
@@ -44,7 +37,26 @@ class Bot(commands.AutoShardedBot):
         self.counter = Counter()
         self.uptime = time.time()
         self.prefix = '.'  # Fallback prefix for DMs and default
+        self.private_matcher = None
         super().__init__(*args, command_prefix=get_prefix, **kwargs)
+        self.db_executor = DatabaseExecutor(self.loop, readers=self.config.getint('database', 'readers', fallback=2))
+        self.web = HTTPClient(limit=self.config.getint('http', 'limit', fallback=100),
+                              limit_per_host=self.config.getint('http', 'limit_per_host', fallback=10),
+                              dns_ttl=self.config.getint('http', 'dns_ttl', fallback=300),
+                              timeout=self.config.getfloat('http', 'timeout', fallback=10.0))
+
+    async def close(self):
+        await super().close()
+        await self.web.close()
+        self.db_executor.shutdown()
+
+    async def prefix_matcher(self, message: discord.Message) -> PrefixMatcher:
+        """Get the prefix matcher that applies to the channel of a message."""
+        if isinstance(message.channel, discord.abc.PrivateChannel):
+            if self.private_matcher is None:
+                self.private_matcher = PrefixMatcher([self.prefix], self.user.id)
+            return self.private_matcher
+        return await self.get_cog('Database').prefix_matcher(message.guild.id)
 
     @staticmethod
     async def embed_notify(ctx: commands.Context, error: int, title: str, message: str = '', raw: bool = False):
@@ -71,6 +83,7 @@ def init(bot_class=Bot):
     @client.event
     async def on_ready():
         client.logger.info(f'[Core] Logged into Discord as {client.user.name} ({client.user.id})')
+        await client.web.start()
         for _, cog in client.config.items('cogs'):
             try:
                 client.load_extension(cog)
@@ -86,6 +99,9 @@ def init(bot_class=Bot):
             await client.embed_notify(ctx, 1, 'Error', 'This command cannot be used in private messages!')
         elif isinstance(error, commands.DisabledCommand):
             await ctx.send(':x: This command has been disabled.')
+        elif isinstance(error, commands.CommandInvokeError) and isinstance(error.original, Busy):
+            await client.embed_notify(ctx, 1, 'Busy', 'The stats service is busy right now, please try again in a '
+                                                      'few seconds!')
         elif isinstance(error, commands.CommandInvokeError):
             raise error
         elif isinstance(error, commands.CommandOnCooldown):
@@ -118,6 +134,8 @@ def init(bot_class=Bot):
 
     @client.event
     async def process_commands(message: discord.Message):
+        if (await client.prefix_matcher(message)).match(message.content) is None:
+            return  # Not a command, skip building the context
         ctx = await client.get_context(message, cls=context.Context)
         if ctx.valid:
             await client.invoke(ctx)
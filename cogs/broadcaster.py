@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import time
+
+import aiohttp
+import discord
+
+from cogs.reddit import OFFICIAL_FLAIRS, Reddit
+from util.cache import LRUCache
+from util.ratelimit import BACKGROUND, Busy, RateLimiter
+
+
+class Broadcaster:
+    """Posts item shop changes and new official Reddit posts to subscribed servers."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        config = self.bot.config
+        # Shared by every shard so the bot stays under the global rate limit with room left for commands
+        self.limiter = RateLimiter(rate=config.getfloat('broadcaster', 'rate', fallback=30),
+                                   burst=config.getint('broadcaster', 'burst', fallback=30),
+                                   concurrency=config.getint('broadcaster', 'concurrency', fallback=20),
+                                   timeout=60, max_queue=10000)
+        self.workers_per_shard = config.getint('broadcaster', 'workers', fallback=4)
+        self.retries = config.getint('broadcaster', 'retries', fallback=3)
+        self.queues = {}  # Shard id -> queue of (guild id, embed)
+        self.workers = []
+        self.hashes = {}  # Shop section -> hash of its contents, seeded by the first check
+        self.posts = LRUCache(5000)  # Ids of the official posts already seen
+        self.posts_since = None  # Only posts created after the first check are new, set by it
+        self.sent = self.failed = 0
+        self.job = self.bot.scheduler.add_job(self.check, 'interval',
+                                              minutes=config.getint('broadcaster', 'interval', fallback=5))
+        self.bot.loop.create_task(self.check())
+
+    def __unload(self):
+        self.job.remove()
+        for worker in self.workers:
+            worker.cancel()
+
+    async def check(self):
+        """Broadcast whatever changed since the last check."""
+        embeds = self.shop_changes()
+        embeds += await self.reddit_changes()
+        for embed in embeds:
+            await self.broadcast(embed)
+
+    def shop_changes(self) -> list:
+        fortnite = self.bot.get_cog('Fortnite')
+        if fortnite is None:
+            return []
+
+        embeds = []
+        for section, sale in fortnite.sales.sales.items():
+            digest = hashlib.sha1(repr((sale.title, [(item.name, item.price) for item in sale.items])).encode())
+            old, self.hashes[section] = self.hashes.get(section), digest.hexdigest()
+            if old is not None and old != self.hashes[section]:
+                embeds.append(shop_embed(sale))
+        return embeds
+
+    async def reddit_changes(self) -> list:
+        reddit = self.bot.get_cog('Reddit')
+        if reddit is None:
+            return []
+
+        try:
+            submissions = await self.bot.loop.run_in_executor(None, official_submissions, reddit)
+        except Exception as e:  # praw raises a variety of request errors, the next check retries
+            self.bot.logger.info(f'[Broadcaster] Could not read Reddit: {e!r}')
+            return []
+
+        if self.posts_since is None:
+            self.posts_since = time.time()
+        # A post leaving the listing and coming back (removed, re-flaired, past the hot window) is not new
+        new = [submission for submission in submissions
+               if submission.id not in self.posts and submission.created_utc > self.posts_since]
+        for submission in submissions:
+            self.posts.set(submission.id, True)
+        return [await Reddit.build_submission_embed(submission) for submission in new]
+
+    async def broadcast(self, embed: discord.Embed):
+        """Queue an embed for every subscribed guild on its shard and wait for delivery."""
+        guilds = [self.bot.get_guild(guild_id) for guild_id in await self.bot.get_cog('Database').subscribed_guilds()]
+        guilds = [guild for guild in guilds if guild is not None]
+        sent, failed = self.sent, self.failed
+
+        shards = set()
+        for guild in guilds:
+            self.queue(guild.shard_id).put_nowait((guild.id, embed))
+            shards.add(guild.shard_id)
+        await asyncio.gather(*[self.queues[shard_id].join() for shard_id in shards])
+        self.bot.logger.info(f'[Broadcaster] Sent "{embed.title}" to {self.sent - sent}/{len(guilds)} guilds '
+                             f'({self.failed - failed} failed).')
+
+    def queue(self, shard_id: int) -> asyncio.Queue:
+        queue = self.queues.get(shard_id)
+        if queue is None:
+            queue = self.queues[shard_id] = asyncio.Queue()
+            self.workers += [self.bot.loop.create_task(self.work(queue)) for _ in range(self.workers_per_shard)]
+        return queue
+
+    async def work(self, queue: asyncio.Queue):
+        while True:
+            guild_id, embed = await queue.get()
+            try:
+                await self.deliver(guild_id, embed)
+            except Exception as e:  # A worker must outlive any one delivery, or its queue never drains
+                self.failed += 1
+                self.bot.logger.error(f'[Broadcaster] Could not deliver to guild {guild_id}: {e!r}')
+            finally:
+                queue.task_done()
+
+    async def deliver(self, guild_id: int, embed: discord.Embed):
+        guild = self.bot.get_guild(guild_id)
+        channel = broadcast_channel(guild) if guild is not None else None
+        if channel is None:
+            self.failed += 1
+            return
+
+        for attempt in range(self.retries + 1):
+            try:
+                await self.limiter.run(lambda: channel.send(embed=embed), BACKGROUND)
+                self.sent += 1
+                return
+            except (discord.Forbidden, discord.NotFound):
+                break  # Permissions changed or the channel is gone, retrying will not help
+            except (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError, Busy):
+                if attempt < self.retries:
+                    await asyncio.sleep(2 ** attempt)
+        self.failed += 1
+
+
+def broadcast_channel(guild: discord.Guild):
+    """The system channel of a guild, or else its first text channel the bot may post embeds in."""
+    channels = [guild.system_channel] if guild.system_channel is not None else []
+    channels += sorted(guild.text_channels, key=lambda c: c.position)
+    for channel in channels:
+        permissions = channel.permissions_for(guild.me)
+        if permissions.send_messages and permissions.embed_links:
+            return channel
+    return None
+
+
+def official_submissions(reddit: Reddit) -> list:
+    """Get the official posts on the front pages of the subreddits. Blocks, runs in an executor."""
+    return [submission for subreddit in reddit.subreddit.values() for submission in subreddit.hot()
+            if str(submission.link_flair_text).upper() in OFFICIAL_FLAIRS]
+
+
+def shop_embed(sale) -> discord.Embed:
+    embed = discord.Embed(color=8198301)
+    embed.title = 'Fortnite: Item Shop Update'
+    embed.description = sale.title
+    for item in sale.items[:25]:
+        embed.add_field(name=item.name, value=str(item.price) + ' V-Bucks')
+    if sale.items:
+        embed.set_thumbnail(url=sale.items[0].image)
+    return embed
+
+
+def setup(bot):
+    bot.add_cog(Broadcaster(bot))
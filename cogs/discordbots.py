@@ -1,4 +1,3 @@
-import aiohttp
 from discord import Guild
 from discord.ext import commands
 
@@ -17,9 +16,8 @@ class DiscordBots:
             "shard_id": guild.shard_id,
             "shard_count": self.bot.shard_count
         }
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.url, data=payload, headers=self.headers) as response:
-                self.bot.logger.info(f'[DiscordBots] Returned {response.status} for {payload}')
+        async with self.bot.web.post(self.url, data=payload, headers=self.headers) as response:
+            self.bot.logger.info(f'[DiscordBots] Returned {response.status} for {payload}')
 
     async def full_send(self):
         shards = [0] * self.bot.shard_count
@@ -32,9 +30,8 @@ class DiscordBots:
                 "shard_id": i,
                 "shard_count": self.bot.shard_count
             }
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.url, data=payload, headers=self.headers) as response:
-                    self.bot.logger.info(f'[DiscordBots] Returned {response.status} for {payload}')
+            async with self.bot.web.post(self.url, data=payload, headers=self.headers) as response:
+                self.bot.logger.info(f'[DiscordBots] Returned {response.status} for {payload}')
 
     async def on_ready(self):
         await self.full_send()
@@ -1,95 +1,47 @@
-import re
-from datetime import datetime
-
-import aiohttp
 import discord
-import pycountry
-from bs4 import BeautifulSoup
 from discord.ext import commands
 
 from util import context
 from util import paginator
+from util.cache import TTLCache
+from util.languages import language_name
+from util.ratelimit import BACKGROUND, INTERACTIVE
+from util.sales import Sale, SaleItem, SalesCatalog
 
 
 class Fortnite:
     """General Fortnite commands and information."""
     def __init__(self, bot):
         self.bot = bot
+        self.sales = SalesCatalog(bot)
+        self.sales_job = self.bot.scheduler.add_job(self.sales.refresh, 'interval',
+                                                    minutes=self.bot.config.getint('fortnite', 'sales_interval',
+                                                                                   fallback=30))
+        self.bot.loop.create_task(self.sales.refresh())
+        self.streams = TTLCache(ttl=self.bot.config.getfloat('fortnite', 'streams_ttl', fallback=60),
+                                stale=self.bot.config.getfloat('fortnite', 'streams_stale', fallback=300))
+        self.lfg_index = {}  # Guild id -> LFG category -> channel ids
+        self.lfg_replies = {}  # Guild id -> rendered lfg reply, None without LFG channels
+
+    def __unload(self):
+        self.sales_job.remove()
 
     @commands.command()
     async def daily(self, ctx: context.Context):
         """Get daily sale items."""
-        url, html = f'https://stormshield.one/pvp/sales', None
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as r:
-                if r.status == 200:
-                    html = await r.text()
-
-        if html is None:
-            return None
-
-        data, soup = {}, BeautifulSoup(html, 'html.parser')
-
-        sale = soup.find_all(class_='sale__items')[1]
-        date = sale.find_previous_sibling(class_="row").h2.text
-        data['date'] = datetime.strptime(date + ' ' + str(datetime.utcnow().year), '%d %b %Y').strftime('%B %d, %Y')
-        images = sale.find_all('img', class_='col')
-        data['images'] = ['https://stormshield.one' + image['src'] for image in images]
-
-        items = sale.find_all('strong')
-        title = [item.parent.text for item in items]
-        title = [item.replace('\n', ' ').strip() for item in title]
-
-        prices, items = [], []
-        regex, regex2 = '\([0-9]+v\)', '[0-9]+'
-        for item in title:
-            match = re.search(regex, item).group(0)
-            prices.append(re.search(regex2, match).group(0))
-            items.append(item.replace(match, '').strip())
-        data['prices'] = prices
-        data['items'] = items
-
-        embeds = []
-        for i in range(len(items)):
-            embeds.append(await self.build_item_embed(data, i))
-        p = paginator.EmbedPages(ctx, entries=embeds)
-        await p.paginate()
+        await self.send_sale(ctx, 'daily')
 
     @commands.command()
     async def weekly(self, ctx: context.Context):
         """Get weekly sale items."""
-        url, html = f'https://stormshield.one/pvp/sales', None
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as r:
-                if r.status == 200:
-                    html = await r.text()
+        await self.send_sale(ctx, 'weekly')
 
-        if html is None:
+    async def send_sale(self, ctx, section: str):
+        sale = await self.sales.get(section)
+        if sale is None:
             return None
 
-        data, soup = {}, BeautifulSoup(html, 'html.parser')
-
-        sale = soup.find_all(class_='sale__items')[0]
-        data['date'] = 'Weekly Sale'
-        images = sale.find_all('img')
-        data['images'] = ['https://stormshield.one' + image['src'] for image in images]
-
-        items = sale.find_all('strong')
-        title = [item.parent.text for item in items]
-        title = [item.replace('\n', ' ').strip() for item in title]
-
-        prices, items = [], []
-        regex, regex2 = '\([0-9]+v\)', '[0-9]+'
-        for item in title:
-            match = re.search(regex, item).group(0)
-            prices.append(re.search(regex2, match).group(0))
-            items.append(item.replace(match, '').strip())
-        data['prices'] = prices
-        data['items'] = items
-
-        embeds = []
-        for i in range(len(items)):
-            embeds.append(await self.build_item_embed(data, i))
+        embeds = [self.build_item_embed(sale, item) for item in sale.items]
         p = paginator.EmbedPages(ctx, entries=embeds)
         await p.paginate()
 
@@ -120,95 +72,123 @@ class Fortnite:
     @commands.command()
     async def twitch(self, ctx):
         """Get the top Fortnite Twitch streamers."""
-        url = 'https://api.partybus.gg/v1/streams'
-        streamers = []
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as r:
-                if r.status == 200:
-                    json = await r.json()
-                    for i in range(0, 10):
-                        streamers.append(json[i])
-
-        embeds = []
-        for streamer in streamers:
-            embeds.append(await self.build_stream_embed(streamer))
+        streamers = await self.streams.get('streams', self.fetch_streams,
+                                           lambda: self.fetch_streams(BACKGROUND)) or []
+        embeds = [self.build_stream_embed(streamer) for streamer in streamers]
         p = paginator.EmbedPages(ctx, icon_url='https://i.imgur.com/dXyljNT.png', entries=embeds)
         await p.paginate()
 
+    async def fetch_streams(self, priority: int = INTERACTIVE):
+        """Get the top ten streams, None if they could not be fetched."""
+        json = await self.bot.web.get_json('https://api.partybus.gg/v1/streams', priority=priority)
+        return json[:10] if json is not None else None
+
     @commands.command()
+    @commands.guild_only()
     async def lfg(self, ctx):
         """Are you looking for a game?"""
-        br_channels, stw_channels, lfg_channels = set(), set(), set()
-        br_list = stw_list = lfg_list = ''
-        for channel in ctx.guild.channels:
-            if isinstance(channel, discord.TextChannel) and 'lfg' in channel.name:
-                if 'br' in channel.name:
-                    br_channels.add(channel)
-                elif 'stw' in channel.name:
-                    stw_channels.add(channel)
-                else:
-                    lfg_channels.add(channel)
-
-        if len(br_channels) > 0:
-            br_list = '**Battle Royale:** '
-            while len(br_channels) > 0:
-                channel = br_channels.pop()
-                if 'br' in channel.name:
-                    br_list += channel.mention
-                    if len(br_channels) > 0:
-                        br_list += ' | '
-            br_list += '\n\n'
-        if len(stw_channels) > 0:
-            stw_list = '**Save the World:** '
-            while len(stw_channels) > 0:
-                channel = stw_channels.pop()
-                if 'stw' in channel.name:
-                    stw_list += channel.mention
-                    if len(stw_channels) > 0:
-                        stw_list += ' | '
-            stw_list += '\n\n'
-        if len(lfg_channels) > 0:
-            lfg_list = '**LFG Channels:** '
-            while len(lfg_channels) > 0:
-                channel = lfg_channels.pop()
-                if 'lfg' in channel.name:
-                    lfg_list += channel.mention
-                    if len(lfg_channels) > 0:
-                        lfg_list += ' | '
-            lfg_list += '\n\n'
-        if len(br_list) or len(stw_list):
-            await ctx.send('Please use any of the #lfg channels if you\'re looking for people to play with:\n\n' +
-                           br_list + stw_list)
-        elif len(lfg_list):
-            await ctx.send('Please use any of the #lfg channels if you\'re looking for people to play with:\n\n' +
-                           lfg_list)
+        if ctx.guild.id not in self.lfg_replies:
+            self.lfg_index[ctx.guild.id] = index_lfg(ctx.guild)
+            self.lfg_replies[ctx.guild.id] = render_lfg(ctx.guild, self.lfg_index[ctx.guild.id])
+
+        reply = self.lfg_replies[ctx.guild.id]
+        if reply is not None:
+            await ctx.send(reply)
         else:
             await self.bot.embed_notify(ctx, 1, 'Error', 'This server does not have any LFG channels setup!\n\n'
                                                          'Please add channels containing *lfg* and optionally either'
                                                          ' *br* or *stw*.\n\n'
                                                          'Example: **lfg_channel**, **lfg_br**, or **lfg_stw_pc**.')
 
+    async def on_guild_channel_create(self, channel):
+        self.lfg_changed(channel.guild, added=channel)
+
+    async def on_guild_channel_delete(self, channel):
+        self.lfg_changed(channel.guild, removed=channel)
+
+    async def on_guild_channel_update(self, before, after):
+        self.lfg_changed(after.guild, removed=before, added=after)
+
+    async def on_guild_remove(self, guild):
+        self.lfg_index.pop(guild.id, None)
+        self.lfg_replies.pop(guild.id, None)
+
+    def lfg_changed(self, guild, removed=None, added=None):
+        """Move a channel in the LFG index of a guild, rendering the reply again if it is affected."""
+        index = self.lfg_index.get(guild.id)
+        if index is None:
+            return  # Indexed on the first lfg command
+
+        changed = False
+        if removed is not None:
+            for channels in index.values():
+                if removed.id in channels:
+                    channels.discard(removed.id)
+                    changed = True
+        category = lfg_category(added) if added is not None else None
+        if category is not None:
+            index[category].add(added.id)
+            changed = True
+        if changed:
+            self.lfg_replies[guild.id] = render_lfg(guild, index)
+
     @staticmethod
-    async def build_item_embed(data: dict, number: int):
+    def build_item_embed(sale: Sale, item: SaleItem):
         embed = discord.Embed(color=8198301)
         embed.title = 'Fortnite: Item Sale'
-        embed.description = data['date']
-        embed.set_thumbnail(url=data['images'][number])
-        embed.add_field(name='Item', value=data['items'][number])
-        embed.add_field(name='Price', value=str(data['prices'][number]) + ' V-Bucks')
+        embed.description = sale.title
+        embed.set_thumbnail(url=item.image)
+        embed.add_field(name='Item', value=item.name)
+        embed.add_field(name='Price', value=str(item.price) + ' V-Bucks')
         return embed
 
     @staticmethod
-    async def build_stream_embed(streamer):
+    def build_stream_embed(streamer):
         embed = discord.Embed(color=6570404)
         embed.title = streamer['displayName']
         embed.description = streamer['status']
         embed.url = f'https://twitch.tv/{streamer["name"]}'
         embed.add_field(name='Viewers', value=str(streamer['viewers']))
-        language = pycountry.languages.lookup(streamer['language'][:2])
-        embed.add_field(name='Language', value=language.name)
+        embed.add_field(name='Language', value=language_name(streamer['language']))
         return embed
 
 
+LFG_LABELS = {'br': 'Battle Royale', 'stw': 'Save the World', 'lfg': 'LFG Channels'}
+
+
+def lfg_category(channel):
+    """The LFG category of a channel, None if it is not an LFG channel."""
+    if not isinstance(channel, discord.TextChannel) or 'lfg' not in channel.name:
+        return None
+    if 'br' in channel.name:
+        return 'br'
+    if 'stw' in channel.name:
+        return 'stw'
+    return 'lfg'
+
+
+def index_lfg(guild) -> dict:
+    index = {category: set() for category in LFG_LABELS}
+    for channel in guild.text_channels:
+        category = lfg_category(channel)
+        if category is not None:
+            index[category].add(channel.id)
+    return index
+
+
+def render_lfg(guild, index: dict):
+    """The lfg reply of a guild, the plain LFG channels are only listed without BR and STW channels."""
+    categories = ('br', 'stw') if index['br'] or index['stw'] else ('lfg',)
+    sections = []
+    for category in categories:
+        channels = [guild.get_channel(channel_id) for channel_id in index[category]]
+        channels = sorted((channel for channel in channels if channel is not None), key=lambda c: c.position)
+        if channels:
+            sections.append(f'**{LFG_LABELS[category]}:** ' + ' | '.join(c.mention for c in channels) + '\n\n')
+    if not sections:
+        return None
+    return 'Please use any of the #lfg channels if you\'re looking for people to play with:\n\n' + ''.join(sections)
+
+
 def setup(bot):
     bot.add_cog(Fortnite(bot))
\ No newline at end of file
@@ -1,13 +1,12 @@
 import platform
 import time
 
-import aiohttp
 import discord
 from discord.ext import commands
 from memory_profiler import memory_usage
-from datetime import datetime, timedelta
 
 from util import context
+from util.player import MODES
 
 
 class General:
@@ -19,35 +18,58 @@ class General:
     @commands.command(hidden=True)
     @commands.is_owner()
     async def party(self, ctx: context.Context):
-        url = 'https://api.partybus.gg/v1/players/Jaksta'
+        stats = await self.bot.get_cog('PartyBus').fetch_player('Jaksta')
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as r:
-                js = await r.json() if r.status == 200 else None
-
-        if js is None:
+        if stats is None:
             return
 
-        modes = [get_mode(js, 2), get_mode(js, 10), get_mode(js, 9)]
-
         player = {
-            'name': js['details']['displayName'],
-            'platform': js['stats'][0]['platform'],
+            'name': stats.name,
+            'platform': stats.platform,
         }
 
-        for mode in modes:
-            player[mode[0]] = {
-                'time': datetime(0, 1, 1) + timedelta(minutes=mode[1]['minutes']),
-                'games': mode[1]['games'],
-                'wins': mode[1]['placeA'],
-                'winRate': round(mode[1]['placeA'] / mode[1]['games'] * 100, 2),
-                'killRate': round(mode[1]['kills'] / mode[1]['games'], 1),
-                'top25': mode[1]['placeB'],
-                'top50': mode[1]['placeC']
+        for playlist, label in MODES.items():
+            mode = stats.modes.get(playlist)
+            if mode is None:
+                continue
+            player[label] = {
+                'time': mode.playtime,
+                'games': mode.games,
+                'wins': mode.wins,
+                'winRate': round(mode.win_rate, 2),
+                'killRate': round(mode.kill_rate, 1),
+                'top25': mode.place_b,
+                'top50': mode.place_c
             }
 
         return player
 
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def metrics(self, ctx: context.Context):
+        """Internal pressure metrics of the bot."""
+        embed = discord.Embed(title='Metrics', colour=discord.Colour.blue())
+        db = self.bot.db_executor.stats()
+        embed.add_field(name='Database Queue',
+                        value=f'{db["pending"]} pending, {db["completed"]} completed\n'
+                              f'Wait {db["avg_wait"]:.1f} ms, latency {db["avg_latency"]:.1f} ms '
+                              f'(max {db["max_latency"]:.1f} ms)', inline=False)
+        flights = self.bot.web.flights
+        embed.add_field(name='HTTP', value=f'{flights.calls} requests, {flights.coalesced} coalesced', inline=False)
+        partybus = self.bot.get_cog('PartyBus')
+        if partybus is not None:
+            cache = partybus.cache.stats()
+            embed.add_field(name='PartyBus Cache',
+                            value=f'{cache["entries"]} entries ({cache["bytes"] // 1024} KB)\n'
+                                  f'{cache["hits"]} hits, {cache["stale_hits"]} stale, {cache["misses"]} misses',
+                            inline=False)
+            limiter = partybus.limiter.stats()
+            embed.add_field(name='PartyBus Scheduler',
+                            value=f'{limiter["queued"]} queued, {limiter["active"]} active\n'
+                                  f'{limiter["scheduled"]} sent (wait {limiter["avg_wait"]:.1f} ms), '
+                                  f'{limiter["rejected"]} rejected', inline=False)
+        await ctx.send(embed=embed)
+
     @commands.command()
     async def donate(self, ctx: context.Context):
         """Can you donate to keep the bot alive?"""
@@ -114,26 +136,15 @@ class General:
     @commands.command()
     async def prefix(self, ctx: context.Context):
         """Get the command prefix of this server."""
-        guild_prefix = ctx.db.get_setting(ctx.guild.id, 'prefix')
-        if guild_prefix.count('|'):
-            prefixes = guild_prefix.split('|')
-            guild_prefix = ''
-            for prefix in prefixes:
-                if len(prefix):
-                    guild_prefix += f'\"{prefix}\" '
+        prefixes = await ctx.db.get_prefixes(ctx.guild.id)
+        if len(prefixes) > 1:
+            guild_prefix = ' '.join(f'\"{prefix}\"' for prefix in prefixes)
             await self.bot.embed_notify(ctx, 2, 'Guild Prefix', f'The prefixes of this server are {guild_prefix}.'
                                                                 f'\nRemember you can also @ me to use commands!')
         else:
-            await self.bot.embed_notify(ctx, 2, 'Guild Prefix', f'The prefix of this server is "{guild_prefix}".'
+            await self.bot.embed_notify(ctx, 2, 'Guild Prefix', f'The prefix of this server is "{prefixes[0]}".'
                                                                 f'\nRemember you can also @ me to use commands!')
 
 
-def get_mode(data: dict, mode: int):
-    mode_str = 'Solo' if mode == 1 else 'Duo' if mode == 10 else 'Squad'
-    for stat in data['stats']:
-        if stat['p'] == mode:
-            return mode_str, stat
-
-
 def setup(bot):
     bot.add_cog(General(bot))
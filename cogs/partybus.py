@@ -1,16 +1,22 @@
+import asyncio
+import io
 from datetime import datetime, timedelta
 from urllib.parse import quote
 
-import aiohttp
 import discord
-from PIL import Image
-from PIL import ImageDraw
-from PIL import ImageFont
 from discord.ext import commands
 from peewee import *
+from playhouse.migrate import SqliteMigrator, migrate
 
-from bot import fortnite_db
 from util import checks
+from util.cache import LRUCache, TTLCache
+from util.database import fortnite_db
+from util.leaderboard import Leaderboard
+from util.names import NameIndex
+from util.paginator import EmbedPages
+from util.player import DUO, SOLO, SQUAD, ModeStats, PlayerStats
+from util.ratelimit import BACKGROUND, INTERACTIVE, Busy, RateLimiter
+from util.render import CardRenderer
 
 
 class PartyBus:
@@ -18,34 +24,166 @@ class PartyBus:
 
     def __init__(self, bot):
         self.bot = bot
+        self.resolved = LRUCache(5000)  # Lookup name (lowercase) -> display name
+        self.updating = set()
+        config = self.bot.config
+        self.missing = TTLCache(ttl=config.getfloat('partybus', 'missing_ttl', fallback=600),
+                                maxbytes=1024 * 1024)  # Lookup names (lowercase) that do not exist
+        self.names = NameIndex()
+        self.cache = TTLCache(ttl=config.getfloat('partybus', 'cache_ttl', fallback=300),
+                              stale=config.getfloat('partybus', 'cache_stale', fallback=900),
+                              maxbytes=config.getint('partybus', 'cache_bytes', fallback=32 * 1024 * 1024))
+        self.limiter = RateLimiter(rate=config.getfloat('partybus', 'rate', fallback=5),
+                                   burst=config.getint('partybus', 'burst', fallback=10),
+                                   concurrency=config.getint('partybus', 'concurrency', fallback=4),
+                                   timeout=config.getfloat('partybus', 'deadline', fallback=5))
+        self.bot.web.limiters['api.partybus.gg'] = self.limiter
+        self.activity = {}  # Discord id -> last command, flushed by the refresher
+        self.refresher = self.bot.scheduler.add_job(self.refresh_linked, 'interval',
+                                                    minutes=config.getint('partybus', 'refresh_interval',
+                                                                          fallback=10))
+        self.renderer = CardRenderer(config.get('partybus', 'card_template', fallback='Fortnite.png'),
+                                     config.get('partybus', 'card_font', fallback='burbank.ttf'),
+                                     workers=config.getint('partybus', 'card_workers', fallback=2))
+        self.accounts = {}  # Discord id -> linked display name
+        self.linked = {}  # Display name (lowercase) -> linked Discord ids
+        self.ranks = {}  # Discord id -> leaderboard values of their linked player
+        self.boards = {}  # Guild id -> Leaderboard of its linked members, built on first use
+        self.memberships = {}  # Discord id -> ids of the guilds with a board they are on
         self.init()
-        self.image_stats = {
-            'name': (427, 90),
-            'solo': {'ratio': (277, 323)},
-            'duo': {'ratio': (659, 323)},
-            'squad': {'ratio': (1042, 323)}
-        }
 
     def init(self):
         if 'player' not in self.bot.db.get_tables():
             self.bot.logger.info('[PartyBus] Created Player table in database.')
             Player.create_table()
+        else:
+            columns = {column.name: column.data_type for column in self.bot.db.get_columns('player')}
+            if 'last_active' not in columns:
+                migrator = SqliteMigrator(self.bot.db)
+                migrate(migrator.add_column('player', 'last_active', DateTimeField(null=True, index=True)))
+            if columns['discord_id'].upper().startswith('VARCHAR'):
+                self.bot.logger.info('[PartyBus] Migrating Player.discord_id to an integer column.')
+                migrate_discord_ids()
+
+        if 'snapshot' not in self.bot.db.get_tables():
+            self.bot.logger.info('[PartyBus] Created Snapshot table in database.')
+            Snapshot.create_table()
+        self.bot.loop.create_task(self.load_linked())
+        self.bot.loop.create_task(self.load_names())
+
+    async def load_names(self):
+        """Index every player name we know of for suggestions."""
+        for name in await self.bot.db_executor.read(known_names):
+            self.names.add(name)
+
+    async def load_linked(self):
+        """Load every linked account and rank it from its snapshot totals, in one query."""
+        rows = await self.bot.db_executor.read(linked_totals)
+        for discord_id, name, games, kills, wins in rows:
+            self.accounts[discord_id] = name
+            self.linked.setdefault(name.lower(), set()).add(discord_id)
+            if games:
+                self.ranks[discord_id] = leaderboard_values(ModeStats(games, kills, wins))
+        self.bot.logger.info(f'[PartyBus] Ranked {len(self.ranks)} of {len(rows)} linked players.')
+
+    def board(self, guild: discord.Guild) -> Leaderboard:
+        """Get the leaderboard of a guild, built from its linked members the first time."""
+        board = self.boards.get(guild.id)
+        if board is None:
+            board = self.boards[guild.id] = Leaderboard(LEADERBOARD_METRICS)
+            for discord_id in self.accounts:
+                if guild.get_member(discord_id) is not None:
+                    self.join_board(guild.id, discord_id)
+        return board
+
+    def join_board(self, guild_id: int, discord_id: int):
+        self.memberships.setdefault(discord_id, set()).add(guild_id)
+        if discord_id in self.ranks:
+            self.boards[guild_id].update(discord_id, self.ranks[discord_id])
+
+    def set_rank(self, discord_id: int, values: dict = None):
+        """Move a Discord user on the boards of their guilds, off them without values."""
+        if values is None:
+            self.ranks.pop(discord_id, None)
+        else:
+            self.ranks[discord_id] = values
+        for guild_id in self.memberships.get(discord_id, ()):
+            board = self.boards.get(guild_id)
+            if board is None:
+                continue
+            if values is None:
+                board.remove(discord_id)
+            else:
+                board.update(discord_id, values)
+
+    async def on_member_join(self, member):
+        if member.guild.id in self.boards and member.id in self.accounts:
+            self.join_board(member.guild.id, member.id)
+
+    async def on_member_remove(self, member):
+        board = self.boards.get(member.guild.id)
+        if board is not None:
+            board.remove(member.id)
+            self.memberships.get(member.id, set()).discard(member.guild.id)
+
+    async def on_guild_remove(self, guild):
+        self.boards.pop(guild.id, None)  # Stale memberships are skipped
+
+    def link(self, discord_id: int, name: str):
+        """Point a Discord id at a new display name and rank it with the stats of that player."""
+        old = self.accounts.get(discord_id)
+        if old is not None:
+            self.linked.get(old.lower(), set()).discard(discord_id)
+        else:
+            for guild_id in self.boards:
+                guild = self.bot.get_guild(guild_id)
+                if guild is not None and guild.get_member(discord_id) is not None:
+                    self.memberships.setdefault(discord_id, set()).add(guild_id)
+        self.accounts[discord_id] = name
+        self.linked.setdefault(name.lower(), set()).add(discord_id)
+        self.set_rank(discord_id)
+
+        stats = self.cache.peek(('player', name.lower()))
+        if stats is not None:
+            self.rank(stats)
+        else:
+            self.bot.loop.create_task(self.player_rank(name))
+
+    async def player_rank(self, name: str):
+        """Fetch a player's stats in the background, which ranks their linked users."""
+        try:
+            await self.cache.get(('player', name.lower()), lambda: self.player_download(name, BACKGROUND))
+        except Busy:
+            pass  # Ranked on the next refresh or stats command
+
+    def rank(self, stats: PlayerStats):
+        """Move the Discord users linked to a player to their new place on the leaderboards."""
+        if stats.overall.games:
+            for discord_id in self.linked.get(stats.name.lower(), ()):
+                self.set_rank(discord_id, leaderboard_values(stats.overall))
+
+    def __unload(self):
+        self.refresher.remove()
+        self.bot.web.limiters.pop('api.partybus.gg', None)
+        self.renderer.shutdown()
 
-    @commands.command(hidden=True)
-    @commands.is_owner()
+    @commands.command()
+    @commands.cooldown(1, 10, commands.BucketType.user)
     @checks.cog_enabled()
-    async def image(self, ctx):
-        player = await self.player_interface(ctx, 'Doctor Jew')
-        embed = await self.player_stats(player, 4)
-        img = Image.open('Fortnite.png')
-        draw = ImageDraw.Draw(img)
-        font = ImageFont.truetype('burbank.ttf', 24)
-        text = '9.02'
-        offset = font.getoffset(text)[1]  # Remove the Y padding
-        w, h = draw.textsize(text, font=font)
-
-        draw.text(((self.image_stats['solo']['ratio'][0] - w) / 2, (self.image_stats['solo']['ratio'][1] - h - offset) / 2), text, font=font)
-        img.save('Fortnite-out.png')
+    async def card(self, ctx, *, name: str = ''):
+        """Return a stats card image for a player or yourself using Partybus.gg"""
+        player = await self.player_interface(ctx, name)
+
+        if len(player) > 0:
+            stats = await self.fetch_player(player)
+            if stats is None:
+                await self.bot.embed_notify(ctx, 2, 'No statistics found!')
+                return
+            card = {'name': stats.name}
+            for key, mode in (('solo', stats.solo), ('duo', stats.duo), ('squad', stats.squad)):
+                card[key] = f'{mode.kd_ratio:.2f}' if mode is not None else '-'
+            png = await self.renderer.render(card)
+            await ctx.send(file=discord.File(io.BytesIO(png), filename=f'{stats.name}.png'))
 
     @commands.command()
     @checks.cog_enabled()
@@ -110,6 +248,112 @@ class PartyBus:
             else:
                 await self.bot.embed_notify(ctx, 1, 'Error', 'No game data found!')
 
+    @commands.command()
+    @checks.cog_enabled()
+    async def progress(self, ctx, *, name: str = ''):
+        """Your win rate and K/D trend over the last week, from stats the bot has seen."""
+        name = await self.player_interface(ctx, name)
+        if not len(name):
+            return
+
+        days = self.bot.config.getint('partybus', 'progress_days', fallback=7)
+        since = datetime.utcnow() - timedelta(days=days)
+        recent, before = await self.bot.db_executor.read(player_progress, name.lower(), since)
+        if not before[0] or not recent[0]:
+            await self.bot.embed_notify(ctx, 2, 'Notice', f'Not enough games of {name} were seen in the last {days} '
+                                                          f'days! Progress is tracked from the stats commands.')
+            return
+
+        embed = discord.Embed(colour=discord.Colour.blue())
+        embed.title = name
+        embed.description = f'Progress over the last {days} days'
+        embed.add_field(name='Games', value=str(recent[0]))
+        embed.add_field(name='Wins', value=str(recent[2]))
+        embed.add_field(name='Kills', value=str(recent[1]))
+        for label, rate in (('Win Rate', win_rate), ('KD Ratio', kd_ratio)):
+            current, previous = rate(*recent), rate(*before)
+            change = current - previous
+            embed.add_field(name=label, value=f'{current:.2f} ({"▲" if change >= 0 else "▼"} {abs(change):.2f})')
+        embed.set_footer(text=f'Compared to all {before[0]} games before')
+        await ctx.send(embed=embed)
+
+    @commands.command(aliases=['vs'])
+    @checks.cog_enabled()
+    async def compare(self, ctx, *names: str):
+        """Compare the overall stats of several players side by side using Partybus.gg"""
+        names = list({name.lower(): name for name in names}.values())
+        if len(names) < 2:
+            await self.bot.embed_notify(ctx, 1, 'Error', 'Enter at least two player names to compare!')
+            return
+        if len(names) > COMPARE_MAX_PLAYERS:
+            await self.bot.embed_notify(ctx, 1, 'Error',
+                                        f'You can compare up to {COMPARE_MAX_PLAYERS} players at a time!')
+            return
+
+        # Look everyone up at once, the total wait is the slowest lookup instead of the sum
+        fan_out = asyncio.Semaphore(self.limiter.concurrency)
+        results = await asyncio.gather(*[self.compare_lookup(name, fan_out) for name in names])
+        found = [stats for stats in results if stats is not None]
+        missing = [name for name, stats in zip(names, results) if stats is None]
+        if not found:
+            await self.bot.embed_notify(ctx, 2, 'No statistics found!')
+            return
+
+        embeds = []
+        for page in range(0, len(found), COMPARE_PER_PAGE):
+            embed = discord.Embed(colour=discord.Colour.blue())
+            embed.title = 'Player Comparison'
+            embed.description = 'Overall Statistics'
+            for stats in found[page:page + COMPARE_PER_PAGE]:
+                embed.add_field(name=stats.name, value=compare_text(stats, found))
+            if missing:
+                embed.set_footer(text='No statistics found for ' + ', '.join(missing))
+            embeds.append(embed)
+
+        if len(embeds) == 1:
+            await ctx.send(embed=embeds[0])
+        else:
+            p = EmbedPages(ctx, entries=embeds)
+            await p.paginate()
+
+    @commands.command(aliases=['lb', 'top'])
+    @commands.guild_only()
+    @checks.cog_enabled()
+    async def leaderboard(self, ctx, metric: str = 'wins'):
+        """Top linked players of this server by wins, kd or winrate."""
+        metric = metric.lower()
+        if metric not in LEADERBOARD_METRICS:
+            await self.bot.embed_notify(ctx, 1, 'Error', 'The leaderboard can be sorted by ' +
+                                        ', '.join(LEADERBOARD_METRICS) + '.')
+            return
+
+        minimum = 0 if metric == 'wins' else LEADERBOARD_MIN_GAMES  # Keep one lucky game off the rate boards
+        entries = []
+        for discord_id, values in self.board(ctx.guild).ranked(metric):
+            member = ctx.guild.get_member(discord_id)
+            if member is not None and values['games'] >= minimum:
+                entries.append((member, values[metric]))
+                if len(entries) == LEADERBOARD_SIZE:
+                    break
+
+        if not entries:
+            await self.bot.embed_notify(ctx, 2, 'Notice', 'Nobody in this server has linked stats yet! Link your Epic ID'
+                                                          ' with ' + self.bot.prefix + 'ign <PlayerName>.')
+            return
+
+        embeds = []
+        for page in range(0, len(entries), 10):
+            embed = discord.Embed(colour=discord.Colour.blue())
+            embed.title = f'{ctx.guild.name} Leaderboard'
+            lines = [f'Sorted by {metric}\n']
+            for rank, (member, value) in enumerate(entries[page:page + 10], start=page + 1):
+                value = f'{value:.2f}' if isinstance(value, float) else str(value)
+                lines.append(f'**{rank}.** {member.display_name} ({value})')
+            embed.description = '\n'.join(lines)
+            embeds.append(embed)
+        p = EmbedPages(ctx, entries=embeds)
+        await p.paginate()
+
     @commands.command()
     @checks.cog_enabled()
     async def ign(self, ctx, *, epic_id: str = ''):
@@ -123,27 +367,29 @@ class PartyBus:
                                             'The Epic ID you entered does not exist! Remember names with spaces need quotes!')
                 return
 
-            try:
-                player = Player.get(Player.discord_id == ctx.author.id)
+            player = await self.bot.db_executor.get(Player, Player.discord_id == ctx.author.id)
+            if player is not None:
                 player.partybus_id = epic_id
-                player.save()
+                await self.bot.db_executor.save(player)
+                self.link(ctx.author.id, epic_id)
                 await self.bot.embed_notify(ctx, 0, 'Epic ID Updated', 'You have updated your Epic ID!')
-            except DoesNotExist:
-                player = Player(partybus_id=player_id, discord_id=ctx.author.id)
-                player.save()
+            else:
+                await self.bot.db_executor.upsert(Player, Player.discord_id == ctx.author.id,
+                                                  partybus_id=player_id, discord_id=ctx.author.id)
+                self.link(ctx.author.id, player_id)
                 await self.bot.embed_notify(ctx, 0, 'Epic ID Updated',
                                             'You have attached your Epic ID to your Discord ID!')
         else:
             # User is requesting their current ID!
-            try:
-                player = Player.get(Player.discord_id == ctx.author.id)
+            partybus_id = self.accounts.get(ctx.author.id)
+            if partybus_id is not None:
                 embed.title = 'Current Epic ID'
                 embed.colour = discord.Colour.blue()
-                embed.description = player.partybus_id
-                embed.url = 'https://partybus.gg/player/' + player.partybus_id
+                embed.description = partybus_id
+                embed.url = 'https://partybus.gg/player/' + partybus_id
                 embed.set_footer(text='Fortnite')
                 await ctx.send(embed=embed)
-            except DoesNotExist:
+            else:
                 await self.bot.embed_notify(ctx, 1, 'Error',
                                             'No player name specified or no Epic ID was found linked to your account!'
                                             + '\n(See \'' + self.bot.prefix
@@ -152,11 +398,12 @@ class PartyBus:
     async def player_interface(self, ctx, name: str) -> str:
         # Command has NOT specified a username
         if not len(name):
-            try:
-                # Player is stored in DB
-                player = Player.get(Player.discord_id == ctx.author.id)
-                name = player.partybus_id
-            except DoesNotExist:
+            partybus_id = self.accounts.get(ctx.author.id)
+            if partybus_id is not None:
+                # Player has linked their Epic ID
+                name = partybus_id
+                self.activity[ctx.author.id] = datetime.utcnow()
+            else:
                 if isinstance(ctx.author, discord.Member):
                     # Public channel message
                     name = ctx.author.nick if ctx.author.nick is not None else ctx.author.name
@@ -164,10 +411,14 @@ class PartyBus:
                     # Private channel. We have to pull by name or DB
                     name = ctx.author.name
 
-        if not (await self.player_load(name))[0]:
+        display_name = await self.player_resolve(name)
+        if display_name is None:
             if len(name):
-                await self.bot.embed_notify(ctx, 1, 'Error',
-                                            'The user you entered does not seem to exist, please re-check the name!')
+                message = 'The user you entered does not seem to exist, please re-check the name!'
+                suggestions = self.names.suggest(name)
+                if suggestions:
+                    message += '\nDid you mean ' + ', '.join(f'**{s}**' for s in suggestions) + '?'
+                await self.bot.embed_notify(ctx, 1, 'Error', message)
             else:
                 await self.bot.embed_notify(ctx, 1, 'Error',
                                             'Your Discord name does not seem to be the same as your Fortnite username,'
@@ -176,168 +427,331 @@ class PartyBus:
                                             + 'ign <PlayerName>!')
             return ''
         else:
-            await self.player_update(name)  # Update the player's data before returning
-            return (await self.player_load(name))[1]
+            # Refresh the player's data upstream while the command fetches its stats
+            if display_name.lower() not in self.updating:
+                self.bot.loop.create_task(self.player_refresh(display_name))
+            return display_name
+
+    async def compare_lookup(self, name: str, fan_out: asyncio.Semaphore):
+        """Resolve and fetch one player of a comparison, None if either failed."""
+        async with fan_out:
+            try:
+                display_name = await self.player_resolve(name)
+                if display_name is None:
+                    return None
+                return await self.fetch_player(display_name)
+            except Busy:
+                return None
 
-    @staticmethod
-    async def player_load(name: str):
+    async def player_resolve(self, name: str):
+        """Resolve a name to the player's display name, None if the player does not exist."""
+        display_name = self.resolved.get(name.lower())
+        if display_name is None:
+            if name.lower() in self.missing:
+                return None  # Known not to exist, save the round trip
+            found, display_name = await self.player_load(name)
+            if not found:
+                return None
+            self.resolved.set(name.lower(), display_name)
+            self.resolved.set(display_name.lower(), display_name)
+            self.names.add(display_name)
+        return display_name
+
+    async def player_refresh(self, name: str):
+        """Run a single background update for a player at a time."""
+        self.updating.add(name.lower())
+        try:
+            await self.player_update(name)
+        except Busy:
+            pass  # Upstream is under pressure, the update can wait for the next command
+        finally:
+            self.updating.discard(name.lower())
+
+    async def refresh_linked(self):
+        """Refresh the stats of linked players, most recently active first, within the request budget."""
+        activity, self.activity = self.activity, {}
+        if activity:
+            await self.bot.db_executor.run(touch_players, activity)
+
+        budget = self.bot.config.getint('partybus', 'refresh_budget', fallback=100)
+        query = (Player.select(Player.partybus_id)
+                 .where((Player.blacklist == False) & (Player.partybus_id != ''))
+                 .order_by(Player.last_active.desc())  # Never active (NULL) sorts last
+                 .limit(budget // 3)  # An update, a history and a stats request per player
+                 .tuples())
+        names = list({name.lower(): name for name, in await self.bot.db_executor.fetch(query)}.values())
+
+        refreshed = 0
+        for i in range(0, len(names), self.limiter.concurrency):
+            try:
+                results = await asyncio.gather(*[self.player_prefetch(name) for name in
+                                                 names[i:i + self.limiter.concurrency]])
+            except Busy:
+                break  # Leave the rest of the budget to interactive commands
+            refreshed += sum(results)
+        self.bot.logger.info(f'[PartyBus] Refreshed stats of {refreshed}/{len(names)} linked players.')
+
+    async def player_prefetch(self, name: str) -> bool:
+        """Update a player upstream and store their fresh stats and newest game in the cache."""
+        await self.player_update(name)
+        stats = await self.player_download(name, BACKGROUND)
+        if stats is None:
+            return False
+        self.cache.set(('player', name.lower()), stats)
+        # Warm lpg too, the update dropped the cached game
+        game = await self.bot.web.get_json_first(history_url(name), priority=BACKGROUND)
+        if game is not None:
+            self.cache.set(('last_game', name.lower()), game)
+        return True
+
+    async def player_load(self, name: str):
         """Load a player for the first time. (Party Bus bug)"""
+        status, json = await self.bot.web.get_json_status('https://api.partybus.gg/v1/players/lookup/' + quote(name))
+        if json is not None:
+            return True, json['displayName']
+        else:
+            if status == 404:
+                self.missing.set(name.lower(), True)
+            return False, ''
 
-        url = 'https://api.partybus.gg/v1/players/lookup/' + quote(name)
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as r:
-                if r.status == 200:
-                    json = await r.json()
-                    return True, json['displayName']
-                else:
-                    return False, ''
-
-    @staticmethod
-    async def player_update(name: str) -> bool:
+    async def player_update(self, name: str) -> bool:
         """Update a player's data through API call."""
         url = f'https://api.partybus.gg/v1/players/{quote(name)}/update'
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as r:
-                return r.status == 200
-
-    @staticmethod
-    async def player_stats(name, mode):
+        if await self.bot.web.get_status(url, priority=BACKGROUND) != 200:
+            return False
+        self.cache.pop(('last_game', name.lower()))  # The update may have added a game
+        return True
+
+    async def fetch_player(self, name: str):
+        """Get the (cached) PartyBus document of a player, None if it could not be fetched."""
+        return await self.cache.get(('player', name.lower()), lambda: self.player_download(name),
+                                    lambda: self.player_download(name, BACKGROUND))
+
+    async def player_download(self, name: str, priority: int = INTERACTIVE):
+        """Download and parse the PartyBus document of a player, recording a snapshot of it."""
+        js = await self.bot.web.get_json('https://api.partybus.gg/v1/players/' + quote(name), priority=priority)
+        if js is None:
+            return None
+        stats = PlayerStats.parse(js)
+        task = self.bot.loop.create_task(self.bot.db_executor.run(record_snapshot, stats))
+        task.add_done_callback(self.snapshot_recorded)
+        self.rank(stats)
+        return stats
+
+    def snapshot_recorded(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.bot.logger.error(f'[PartyBus] Could not record a snapshot: {task.exception()!r}')
+
+    async def fetch_last_game(self, name: str):
+        """Get the (cached) most recent game of a player, None if it could not be fetched."""
+        url = history_url(name)
+        return await self.cache.get(('last_game', name.lower()), lambda: self.bot.web.get_json_first(url),
+                                    lambda: self.bot.web.get_json_first(url, priority=BACKGROUND))
+
+    async def player_stats(self, name, mode):
         """Get the general stats for a Fortnite player."""
-        url = 'https://api.partybus.gg/v1/players/' + quote(name)
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as r:
-                if r.status == 200:
-                    js = await r.json()
-
-                    embed = discord.Embed()
-
-                    embed.title = js['details']['displayName']
-                    embed.url = 'https://partybus.gg/player/' + quote(js['details']['displayName'])
-
-                    platform = js['stats'][0]['platform']
-                    if platform == 'pc':
-                        embed.set_footer(text='PC',
-                                         icon_url='https://upload.wikimedia.org/wikipedia/commons/thumb/5/5f/Windows_logo_-_2012.svg/768px-Windows_logo_-_2012.svg.png')
-                        embed.colour = 44527
-                    elif platform == 'ps4':
-                        embed.set_footer(text='PS4',
-                                         icon_url='https://psmedia.playstation.com/is/image/psmedia/404-three-column-playstationlogo-01-en-19feb15?$ThreeColFeature_Image$')
-                        embed.colour = discord.Colour.dark_blue()
-                    elif platform == 'xb1':
-                        embed.set_footer(text='XB1',
-                                         icon_url='https://upload.wikimedia.org/wikipedia/commons/thumb/f/f9/Xbox_one_logo.svg/2000px-Xbox_one_logo.svg.png')
-                        embed.colour = 1080335
-
-                    if mode == 1:
-                        embed.description = 'Solo Statistics'
-                        for stat in js['stats']:
-                            if stat['p'] == 2:
-                                minutes = timedelta(minutes=int(stat['minutes']))
-                                time = datetime(1, 1, 1) + minutes
-                                time = '{}D {}H {}M'.format(time.day - 1, time.hour, time.minute)
-                                embed.description += f' ({time})'
-                                embed.add_field(name='Total Games', value=str(stat['games']))
-                                embed.add_field(name='Wins', value=str(stat['placeA']))
-                                embed.add_field(name='Win Rate',
-                                                value=str(round(stat['placeA'] / stat['games'] * 100, 2)) + '%')
-                                embed.add_field(name='KD Ratio',
-                                                value=str(round(stat['kills'] / (stat['games'] - stat['placeA']), 1)))
-                                embed.add_field(name='Top 10s', value=str(stat['placeB']))
-                                embed.add_field(name='Top 25s', value=str(stat['placeC']))
-                                return embed
-                        return None
-                    elif mode == 2:
-                        embed.description = 'Duo Statistics'
-                        for stat in js['stats']:
-                            if stat['p'] == 10:
-                                minutes = timedelta(minutes=int(stat['minutes']))
-                                time = datetime(1, 1, 1) + minutes
-                                time = '{}D {}H {}M'.format(time.day - 1, time.hour, time.minute)
-                                embed.description += f' ({time})'
-                                embed.add_field(name='Total Games', value=str(stat['games']))
-                                embed.add_field(name='Wins', value=str(stat['placeA']))
-                                embed.add_field(name='Win Rate',
-                                                value=str(round(stat['placeA'] / stat['games'] * 100, 2)) + '%')
-                                embed.add_field(name='Kill Rate', value=str(round(stat['kills'] / stat['games'], 1)))
-                                embed.add_field(name='Top 5s', value=str(stat['placeB']))
-                                embed.add_field(name='Top 12s', value=str(stat['placeC']))
-                                return embed
-                        return None
-                    elif mode == 3:
-                        embed.description = 'Squad Statistics'
-                        for stat in js['stats']:
-                            if stat['p'] == 9:
-                                minutes = timedelta(minutes=int(stat['minutes']))
-                                time = datetime(1, 1, 1) + minutes
-                                time = '{}D {}H {}M'.format(time.day - 1, time.hour, time.minute)
-                                embed.description += f' ({time})'
-                                embed.add_field(name='Total Games', value=str(stat['games']))
-                                embed.add_field(name='Wins', value=str(stat['placeA']))
-                                embed.add_field(name='Win Rate',
-                                                value=str(round(stat['placeA'] / stat['games'] * 100, 2)) + '%')
-                                embed.add_field(name='Kill Rate', value=str(round(stat['kills'] / stat['games'], 1)))
-                                embed.add_field(name='Top 3s', value=str(stat['placeB']))
-                                embed.add_field(name='Top 6s', value=str(stat['placeC']))
-                                return embed
-                        return None
-                    elif mode == 4:
-                        embed.description = 'Overall Statistics'
-                        kills = time = wins = top25 = top10 = games = 0
-                        for stat in js['stats']:
-                            games += stat['games']
-                            kills += stat['kills']
-                            time += stat['minutes']
-                            wins += stat['placeA']
-                            top10 += stat['placeB']
-                            top25 += stat['placeC']
-                        minutes = timedelta(minutes=int(time))
-                        time = datetime(1, 1, 1) + minutes
-                        time = '{}D {}H {}M'.format(time.day - 1, time.hour, time.minute)
-                        embed.description += f' ({time})'
-                        embed.add_field(name='Total Games', value=str(games))
-                        embed.add_field(name='Wins', value=str(wins))
-                        embed.add_field(name='Win Rate', value=str(round(wins / games * 100, 2)) + '%')
-                        embed.add_field(name='Kill Rate', value=str(round(kills / games, 1)))
-                        embed.add_field(name='Top 25%', value=str(round(top25 / games * 100, 2)) + '%')
-                        embed.add_field(name='Top 10%', value=str(round(top10 / games * 100, 2)) + '%')
-                        return embed
+        stats = await self.fetch_player(name)
+        if stats is not None:
+            return self.stats_embed(stats, mode)
 
     @staticmethod
-    async def player_lpg(name):
-        url = 'https://api.partybus.gg/v1/players/' + quote(name) + '/history?p='
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as r:
-                if r.status == 200:
-                    js = await r.json()
-                    game = js[0]
-
-                    embed = discord.Embed()
-                    embed.colour = discord.Colour.green() if game['placeA'] > 0 else discord.Colour.dark_red()
-                    embed.title = 'Game Played ' + datetime.fromtimestamp(game['modified']).strftime(
-                        '%Y-%m-%d') + ' (UTC)'
-                    embed.description = 'Duration: ' + str(game['minutes']) + ' Min.'
-                    embed.add_field(name='Mode',
-                                    value='Solo' if game['p'] == 2 else 'Duo' if game['p'] == 10 else 'Squad')
-                    embed.add_field(name='Result', value='Victory' if game['placeA'] > 0 else 'Lost')
-                    embed.add_field(name='Kills', value=game['kills'])
-
-                    platform = game['platform']
-                    if platform == 'pc':
-                        embed.set_footer(text='PC',
-                                         icon_url='https://upload.wikimedia.org/wikipedia/commons/thumb/5/5f/Windows_logo_-_2012.svg/768px-Windows_logo_-_2012.svg.png')
-                    elif platform == 'ps4':
-                        embed.set_footer(text='PS4',
-                                         icon_url='https://psmedia.playstation.com/is/image/psmedia/404-three-column-playstationlogo-01-en-19feb15?$ThreeColFeature_Image$')
-                    elif platform == 'xb1':
-                        embed.set_footer(text='XB1',
-                                         icon_url='https://upload.wikimedia.org/wikipedia/commons/thumb/f/f9/Xbox_one_logo.svg/2000px-Xbox_one_logo.svg.png')
-
-                    return embed
+    def stats_embed(stats: PlayerStats, mode: int):
+        """Build the embed of one mode (1 solo, 2 duo, 3 squad, 4 overall) of a player's stats."""
+        embed = discord.Embed()
+        embed.title = stats.name
+        embed.url = 'https://partybus.gg/player/' + quote(stats.name)
+        set_platform(embed, stats.platform, colour=True)
+
+        if mode == 4:
+            overall = stats.overall
+            if not overall.games:
                 return None
+            embed.description = f'Overall Statistics ({overall.playtime})'
+            embed.add_field(name='Total Games', value=str(overall.games))
+            embed.add_field(name='Wins', value=str(overall.wins))
+            embed.add_field(name='Win Rate', value=str(round(overall.win_rate, 2)) + '%')
+            embed.add_field(name='Kill Rate', value=str(round(overall.kill_rate, 1)))
+            embed.add_field(name='Top 25%', value=str(round(overall.place_c / overall.games * 100, 2)) + '%')
+            embed.add_field(name='Top 10%', value=str(round(overall.place_b / overall.games * 100, 2)) + '%')
+            return embed
+
+        label, playlist, place_b, place_c = STATS_VIEWS[mode]
+        stat = stats.modes.get(playlist)
+        if stat is None:
+            return None
+        embed.description = f'{label} Statistics ({stat.playtime})'
+        embed.add_field(name='Total Games', value=str(stat.games))
+        embed.add_field(name='Wins', value=str(stat.wins))
+        embed.add_field(name='Win Rate', value=str(round(stat.win_rate, 2)) + '%')
+        if playlist == SOLO:
+            embed.add_field(name='KD Ratio', value=str(round(stat.kd_ratio, 1)))
+        else:
+            embed.add_field(name='Kill Rate', value=str(round(stat.kill_rate, 1)))
+        embed.add_field(name=place_b, value=str(stat.place_b))
+        embed.add_field(name=place_c, value=str(stat.place_c))
+        return embed
+
+    async def player_lpg(self, name):
+        game = await self.fetch_last_game(name)
+        if game is not None:
+            embed = discord.Embed()
+            embed.colour = discord.Colour.green() if game['placeA'] > 0 else discord.Colour.dark_red()
+            embed.title = 'Game Played ' + datetime.fromtimestamp(game['modified']).strftime(
+                '%Y-%m-%d') + ' (UTC)'
+            embed.description = 'Duration: ' + str(game['minutes']) + ' Min.'
+            embed.add_field(name='Mode',
+                            value='Solo' if game['p'] == 2 else 'Duo' if game['p'] == 10 else 'Squad')
+            embed.add_field(name='Result', value='Victory' if game['placeA'] > 0 else 'Lost')
+            embed.add_field(name='Kills', value=game['kills'])
+
+            set_platform(embed, game['platform'])
+
+            return embed
+        return None
+
+
+def history_url(name: str) -> str:
+    return 'https://api.partybus.gg/v1/players/' + quote(name) + '/history?p='
+
+
+def touch_players(activity: dict):
+    """Store the last command time of players in a single transaction."""
+    with fortnite_db.atomic():
+        for discord_id, last_active in activity.items():
+            Player.update(last_active=last_active).where(Player.discord_id == discord_id).execute()
+
+
+PLATFORMS = {
+    'pc': ('PC', 'https://upload.wikimedia.org/wikipedia/commons/thumb/5/5f/Windows_logo_-_2012.svg/768px-Windows_logo_-_2012.svg.png',
+           44527),
+    'ps4': ('PS4', 'https://psmedia.playstation.com/is/image/psmedia/404-three-column-playstationlogo-01-en-19feb15?$ThreeColFeature_Image$',
+            discord.Colour.dark_blue()),
+    'xb1': ('XB1', 'https://upload.wikimedia.org/wikipedia/commons/thumb/f/f9/Xbox_one_logo.svg/2000px-Xbox_one_logo.svg.png',
+            1080335)
+}
+
+# Stats command mode -> (label, playlist, placeB label, placeC label)
+STATS_VIEWS = {
+    1: ('Solo', SOLO, 'Top 10s', 'Top 25s'),
+    2: ('Duo', DUO, 'Top 5s', 'Top 12s'),
+    3: ('Squad', SQUAD, 'Top 3s', 'Top 6s')
+}
+
+
+LEADERBOARD_METRICS = ('wins', 'kd', 'winrate')
+LEADERBOARD_MIN_GAMES = 25
+LEADERBOARD_SIZE = 100
+
+
+COMPARE_MAX_PLAYERS = 12
+COMPARE_PER_PAGE = 3  # Inline fields fit three to a row
+
+
+COMPARE_LINES = (('Games', 'games', '{:d}'), ('Wins', 'wins', '{:d}'), ('Win Rate', 'win_rate', '{:.2f}%'),
+                 ('K/D', 'kd_ratio', '{:.2f}'), ('Kill Rate', 'kill_rate', '{:.1f}'))
+
+
+def compare_text(stats: PlayerStats, players: list) -> str:
+    """The overall stat lines of one player in a comparison, with the best of each line in bold."""
+    lines = []
+    for label, key, fmt in COMPARE_LINES:
+        value = getattr(stats.overall, key)
+        text = label + ': ' + fmt.format(value)
+        if value and value == max(getattr(other.overall, key) for other in players):
+            text = '**' + text + '**'
+        lines.append(text)
+    return '\n'.join(lines)
+
+
+def leaderboard_values(stats: ModeStats) -> dict:
+    return {'wins': stats.wins, 'kd': stats.kd_ratio, 'winrate': stats.win_rate, 'games': stats.games}
+
+
+def set_platform(embed: discord.Embed, platform: str, colour: bool = False):
+    """Set the platform footer (and colour) of an embed."""
+    if platform in PLATFORMS:
+        text, icon_url, platform_colour = PLATFORMS[platform]
+        embed.set_footer(text=text, icon_url=icon_url)
+        if colour:
+            embed.colour = platform_colour
+
+
+def record_snapshot(stats: PlayerStats):
+    """Store the change in a player's stats per mode since the last snapshot."""
+    player = stats.name.lower()
+    totals = {mode: row for mode, *row in Snapshot
+              .select(Snapshot.mode, fn.SUM(Snapshot.games), fn.SUM(Snapshot.kills), fn.SUM(Snapshot.place_a),
+                      fn.SUM(Snapshot.place_b), fn.SUM(Snapshot.place_c), fn.SUM(Snapshot.minutes))
+              .where(Snapshot.player == player)
+              .group_by(Snapshot.mode)
+              .tuples()}
+
+    now, rows = datetime.utcnow(), []
+    for mode, stat in stats.modes.items():
+        delta = [value - (total or 0) for value, total in zip(stat.totals(), totals.get(mode, [0] * 6))]
+        if any(delta):
+            rows.append(dict(zip(('games', 'kills', 'place_a', 'place_b', 'place_c', 'minutes'), delta),
+                             player=player, mode=mode, time=now))
+    if rows:
+        Snapshot.insert_many(rows).execute()
+
+
+def player_progress(player: str, since: datetime):
+    """Sum a player's games, kills and wins over all modes since a time, and before it."""
+    def totals(where):
+        query = Snapshot.select(fn.SUM(Snapshot.games), fn.SUM(Snapshot.kills), fn.SUM(Snapshot.place_a))
+        return [value or 0 for value in query.where((Snapshot.player == player) & where).tuples()[0]]
+
+    first = Snapshot.select(Snapshot.time).where(Snapshot.player == player).order_by(Snapshot.time).first()
+    if first is not None and first.time >= since:
+        # Tracking started inside the window, the first snapshot holds the career totals so far
+        return totals(Snapshot.time > first.time), totals(Snapshot.time <= first.time)
+    return totals(Snapshot.time >= since), totals(Snapshot.time < since)
+
+
+def migrate_discord_ids():
+    """Recreate the player table with an integer discord_id, SQLite cannot change the type of a column."""
+    with fortnite_db.atomic():
+        fortnite_db.execute_sql('CREATE TABLE player_new (id INTEGER NOT NULL PRIMARY KEY, '
+                                'partybus_id VARCHAR(255) NOT NULL, discord_id INTEGER NOT NULL, '
+                                'blacklist INTEGER NOT NULL, last_active DATETIME)')
+        fortnite_db.execute_sql('INSERT INTO player_new (id, partybus_id, discord_id, blacklist, last_active) '
+                                'SELECT id, partybus_id, CAST(discord_id AS INTEGER), blacklist, last_active '
+                                'FROM player')
+        fortnite_db.execute_sql('DROP TABLE player')
+        fortnite_db.execute_sql('ALTER TABLE player_new RENAME TO player')
+        Player._schema.create_indexes()
+
+
+def known_names():
+    """Get the names of all linked and recorded players."""
+    linked = Player.select(Player.partybus_id).where(Player.partybus_id != '').tuples()
+    recorded = Snapshot.select(Snapshot.player).distinct().tuples()
+    return [name for name, in linked] + [name for name, in recorded]
+
+
+def linked_totals():
+    """Get every linked player with their overall snapshot totals (zero if never seen)."""
+    totals = (Snapshot
+              .select(Snapshot.player, fn.SUM(Snapshot.games).alias('games'), fn.SUM(Snapshot.kills).alias('kills'),
+                      fn.SUM(Snapshot.place_a).alias('wins'))
+              .group_by(Snapshot.player)
+              .alias('totals'))
+    query = (Player
+             .select(Player.discord_id, Player.partybus_id, totals.c.games, totals.c.kills, totals.c.wins)
+             .join(totals, JOIN.LEFT_OUTER, on=(totals.c.player == fn.LOWER(Player.partybus_id)))
+             .where(Player.partybus_id != '')
+             .tuples())
+    return [(discord_id, name, games or 0, kills or 0, wins or 0) for discord_id, name, games, kills, wins in query]
+
+
+def win_rate(games: int, kills: int, wins: int) -> float:
+    return wins / games * 100 if games else 0.0
+
+
+def kd_ratio(games: int, kills: int, wins: int) -> float:
+    return kills / (games - wins) if games > wins else float(kills)
 
 
 class BaseModel(Model):
@@ -347,8 +761,25 @@ class BaseModel(Model):
 
 class Player(BaseModel):
     partybus_id = CharField(default='')  # This should be unique, but no way to authenticate users
-    discord_id = CharField(unique=True)
+    discord_id = BigIntegerField(unique=True)
     blacklist = BooleanField(default=False)
+    last_active = DateTimeField(null=True, index=True)  # Last stats command, orders the background refresh
+
+
+class Snapshot(BaseModel):
+    """The change in a player's stats in one mode, between two fetches of their stats."""
+    player = CharField()  # Lowercase display name
+    mode = SmallIntegerField()  # PartyBus playlist: 2 solo, 10 duo, 9 squad
+    time = DateTimeField(default=datetime.utcnow)
+    games = IntegerField(default=0)
+    kills = IntegerField(default=0)
+    place_a = IntegerField(default=0)  # Wins
+    place_b = IntegerField(default=0)
+    place_c = IntegerField(default=0)
+    minutes = IntegerField(default=0)
+
+    class Meta:
+        indexes = ((('player', 'mode', 'time'), False),)
 
 
 def setup(bot):
@@ -57,7 +57,7 @@ class Reddit:
         embeds = []
         for _, subreddit in self.subreddit.items():
             for submission in subreddit.hot():
-                if str(submission.link_flair_text).upper() in ['OFFICIAL', 'EPIC RESPONSE', 'EPIC', 'EPIC COMMENT']:
+                if str(submission.link_flair_text).upper() in OFFICIAL_FLAIRS:
                     embeds.append(await self.build_submission_embed(submission))
 
         if not len(embeds):
@@ -79,5 +79,8 @@ class Reddit:
         return embed
 
 
+OFFICIAL_FLAIRS = ('OFFICIAL', 'EPIC RESPONSE', 'EPIC', 'EPIC COMMENT')
+
+
 def setup(bot):
     bot.add_cog(Reddit(bot))
@@ -27,7 +27,7 @@ class Settings:
     @checks.is_admin()
     async def reset(self, ctx: context.Context):
         """Reset the server's settings"""
-        changed = ctx.db.reset(ctx.guild.id)
+        changed = await ctx.db.reset(ctx.guild.id)
         if changed:
             await self.bot.embed_notify(ctx, 0, 'Settings Reset', 'The server settings were reset! (Including prefix)')
 
@@ -43,17 +43,13 @@ class Settings:
     @checks.is_admin()
     async def prefix_get(self, ctx: context.Context):
         """Get the prefix for this server."""
-        guild_prefix = ctx.db.get_setting(ctx.guild.id, 'prefix')
-        if guild_prefix.count('|'):
-            prefixes = guild_prefix.split('|')
-            guild_prefix = ''
-            for prefix in prefixes:
-                if len(prefix):
-                    guild_prefix += f'\"{prefix}\" '
+        prefixes = await ctx.db.get_prefixes(ctx.guild.id)
+        if len(prefixes) > 1:
+            guild_prefix = ' '.join(f'\"{prefix}\"' for prefix in prefixes)
             await self.bot.embed_notify(ctx, 2, 'Guild Prefix', f'The prefixes of this server are {guild_prefix}.'
                                                                 f'\nRemember you can also @ me to use commands!')
         else:
-            await self.bot.embed_notify(ctx, 2, 'Guild Prefix', f'The prefix of this server is "{guild_prefix}".'
+            await self.bot.embed_notify(ctx, 2, 'Guild Prefix', f'The prefix of this server is "{prefixes[0]}".'
                                                                 f'\nRemember you can also @ me to use commands!')
 
     @prefix.command(name='set')
@@ -68,7 +64,7 @@ class Settings:
             await self.bot.embed_notify(ctx, 1, 'Guild Prefix Error',
                                         f'Your prefix cannot start with the character {new_prefix[0]}')
             return
-        changed = ctx.db.set_setting(ctx.guild.id, 'prefix', new_prefix)
+        changed = await ctx.db.set_prefixes(ctx.guild.id, [new_prefix])
         if changed:
             await self.bot.embed_notify(ctx, 2, 'Guild Prefix', f'The prefix of this server is now "{new_prefix}".'
                                                                 f'\nRemember you can also @ me to use commands!')
@@ -87,20 +83,11 @@ class Settings:
             await self.bot.embed_notify(ctx, 1, 'Guild Prefix Error',
                                         f'Your prefix cannot start with the character {new_prefix[0]}')
             return
-        current = ctx.db.get_setting(ctx.guild.id, 'prefix')
-        if '|' in current:  # Multiple prefixes
-            if new_prefix in current.split('|'):
-                await self.bot.embed_notify(ctx, 1, 'Guild Prefix Error', 'This prefix already exists!')
-                return
-            else:  # Add the prefix to the existing list
-                current += new_prefix + '|'
-        else:
-            if new_prefix in current:
-                await self.bot.embed_notify(ctx, 1, 'Guild Prefix Error', 'This prefix already exists!')
-                return
-            else:
-                current += '|' + new_prefix + '|'
-        changed = ctx.db.set_setting(ctx.guild.id, 'prefix', current)
+        current = await ctx.db.get_prefixes(ctx.guild.id)
+        if new_prefix in current:
+            await self.bot.embed_notify(ctx, 1, 'Guild Prefix Error', 'This prefix already exists!')
+            return
+        changed = await ctx.db.set_prefixes(ctx.guild.id, current + [new_prefix])
         if changed:
             await self.bot.embed_notify(ctx, 2, 'Guild Prefix', f'The prefix "{new_prefix}" has been added.'
                                                                 f'\nRemember you can also @ me to use commands!')
@@ -115,20 +102,17 @@ class Settings:
         if '|' in prefix:
             await self.bot.embed_notify(ctx, 1, 'Guild Prefix Error', 'Prefixes cannot contain the character \'|\'')
             return
-        current = ctx.db.get_setting(ctx.guild.id, 'prefix')
-        if '|' in current:
+        current = await ctx.db.get_prefixes(ctx.guild.id)
+        if len(current) > 1:
             if prefix not in current:
                 await self.bot.embed_notify(ctx, 1, 'Guild Prefix Error', 'This prefix does not exist!')
                 return
-            if current.count('|') == 2:
-                current = current.replace('|' + prefix + '|', '')
-            else:
-                current = current.replace(prefix + '|', '')
+            current.remove(prefix)
         else:  # We only have one prefix
             await self.bot.embed_notify(ctx, 1, 'Guild Prefix Error', 'You must have at least one prefix! '
                                                                       'Please use prefix reset to set default.')
             return
-        changed = ctx.db.set_setting(ctx.guild.id, 'prefix', current)
+        changed = await ctx.db.set_prefixes(ctx.guild.id, current)
         if changed:
             await self.bot.embed_notify(ctx, 2, 'Guild Prefix', f'The prefix "{prefix}" has been removed.'
                                                                 f'\nRemember you can also @ me to use commands!')
@@ -140,13 +124,26 @@ class Settings:
     @checks.is_admin()
     async def prefix_reset(self, ctx: context.Context):
         """Reset the server prefix to the default"""
-        changed = ctx.db.set_setting(ctx.guild.id, 'prefix', self.bot.prefix)
+        changed = await ctx.db.set_prefixes(ctx.guild.id, [])
         if changed:
             await self.bot.embed_notify(ctx, 2, 'Guild Prefix', f'The prefix has been reset to "{self.bot.prefix}".'
                                                                 f'\nRemember you can also @ me to use commands!')
         else:
             await self.bot.embed_notify(ctx, 1, 'Guild Prefix', 'Error changing the server prefix!')
 
+    @settings.command()
+    @commands.guild_only()
+    @checks.is_admin()
+    async def subscribe(self, ctx: context.Context, value: bool):
+        """Post item shop updates and official Reddit posts in this server. Value must be true/false."""
+        await ctx.db.set_subscribed(ctx.guild.id, value)
+        if value:
+            await self.bot.embed_notify(ctx, 2, 'Subscription', 'This server will now receive item shop updates and'
+                                                                ' official Reddit posts!')
+        else:
+            await self.bot.embed_notify(ctx, 2, 'Subscription', 'This server will no longer receive item shop updates'
+                                                                ' and official Reddit posts.')
+
     @settings.group(aliases=['extension', 'plugin'])
     @commands.guild_only()
     @checks.is_admin()
@@ -166,7 +163,7 @@ class Settings:
             await self.bot.embed_notify(ctx, 2, 'List of Extensions', cog_list)
             return
         cog = cog.capitalize()
-        enabled = ctx.db.get_cog(ctx.guild.id, cog)
+        enabled = await ctx.db.get_cog(ctx.guild.id, cog)
         if enabled:
             await self.bot.embed_notify(ctx, 2, 'Extension', f'The {cog} extension is enabled!')
         else:
@@ -181,7 +178,7 @@ class Settings:
             await self.bot.embed_notify(ctx, 1, 'Error', 'You cannot disable core extensions!')
             return
         cog = cog.capitalize()
-        changed = ctx.db.set_cog(ctx.guild.id, cog, value)
+        changed = await ctx.db.set_cog(ctx.guild.id, cog, value)
         if changed:
             await self.bot.embed_notify(ctx, 2, 'Extension', f'The {cog} extension is now '
                                                              f'{str("enabled") if value else str("disabled")}!')
@@ -6,8 +6,8 @@ import discord
 from discord.ext import commands
 from peewee import *
 
-from bot import fortnite_db
 from util import checks
+from util.database import fortnite_db
 
 
 class Stats:
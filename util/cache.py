@@ -0,0 +1,163 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entry once full."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single in-flight call.
+
+    Callers arriving while a call for their key is running await that call and share its result.
+    """
+
+    def __init__(self):
+        self.calls = self.coalesced = 0
+        self._flights = {}
+
+    async def do(self, key, fetch):
+        future = self._flights.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            future = asyncio.ensure_future(fetch())
+            self._flights[key] = future
+            future.add_done_callback(lambda _: self._flights.pop(key, None))
+        return await asyncio.shield(future)  # A cancelled caller must not cancel the others
+
+
+class TTLCache:
+    """An LRU cache of expiring entries, bounded by the approximate memory of its values.
+
+    Entries older than ttl are stale. A stale entry is still served for up to stale more
+    seconds while a single background refresh replaces it.
+    """
+
+    def __init__(self, *, ttl: float, stale: float = 0, maxbytes: int = 16 * 1024 * 1024, sizeof=None):
+        self.ttl = ttl
+        self.stale = stale
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof or approximate_size
+        self.size = 0
+        self.hits = self.stale_hits = self.misses = 0
+        self._data = OrderedDict()  # key -> (value, size, stored)
+        self._refreshing = set()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        """Whether key has a value that is fresh or may still be served stale."""
+        entry = self._data.get(key)
+        return entry is not None and time.monotonic() - entry[2] < self.ttl + self.stale
+
+    async def get(self, key, fetch, refresh=None):
+        """Get the value of key, awaiting fetch() to load it when missing or expired.
+
+        A stale value is replaced in the background by refresh(), fetch() if not given.
+        Values of None are never cached.
+        """
+        entry = self._data.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[2]
+            if age < self.ttl:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return entry[0]
+            if age < self.ttl + self.stale:
+                self.stale_hits += 1
+                self._data.move_to_end(key)
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    asyncio.ensure_future(self._refresh(key, refresh or fetch))
+                return entry[0]
+
+        self.misses += 1
+        value = await fetch()
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    async def _refresh(self, key, fetch):
+        try:
+            value = await fetch()
+            if value is not None:
+                self.set(key, value)
+        except Exception:
+            pass  # Keep serving the stale value, the next request retries
+        finally:
+            self._refreshing.discard(key)
+
+    def peek(self, key, default=None):
+        """Get the value of key if present, fresh or not, without counting or refreshing."""
+        entry = self._data.get(key)
+        return entry[0] if entry is not None else default
+
+    def set(self, key, value):
+        self.pop(key)
+        size = self.sizeof(value)
+        self._data[key] = (value, size, time.monotonic())
+        self.size += size
+        while self.size > self.maxbytes and len(self._data) > 1:
+            _, (_, evicted, _) = self._data.popitem(last=False)
+            self.size -= evicted
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        self.size -= entry[1]
+        return entry[0]
+
+    def stats(self) -> dict:
+        return {'entries': len(self._data), 'bytes': self.size, 'hits': self.hits,
+                'stale_hits': self.stale_hits, 'misses': self.misses}
+
+
+def approximate_size(value) -> int:
+    """Approximate the memory held by a JSON-like value or an object with __slots__."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approximate_size(item) for item in value)
+    elif hasattr(value, '__slots__'):
+        size += sum(approximate_size(getattr(value, slot)) for slot in value.__slots__)
+    return size
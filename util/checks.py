@@ -73,8 +73,8 @@ def admin_or_permissions(**perms):
 
 
 def cog_enabled():
-    def predicate(ctx: context.Context):
-        return ctx.db.get_cog(ctx.guild.id, ctx.command.cog_name)
+    async def predicate(ctx: context.Context):
+        return await ctx.db.get_cog(ctx.guild.id, ctx.command.cog_name)
 
     return commands.check(predicate)
 
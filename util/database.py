@@ -1,120 +1,256 @@
+import json
+
 from peewee import *
-from playhouse.sqlite_ext import SqliteExtDatabase, JSONField
+from peewee import chunked
+from playhouse.migrate import SqliteMigrator, migrate
+from playhouse.sqlite_ext import SqliteExtDatabase
+
+from util.cache import LRUCache
+from util.prefix import PrefixMatcher, split_prefixes
+
+# The one connection manager every model binds to. Peewee keeps a connection per thread,
+# WAL lets the reader threads run while the database thread writes.
+fortnite_db = SqliteExtDatabase('data/fortnite.db', timeout=10, cached_statements=256, pragmas=(
+    ('journal_mode', 'wal'),
+    ('synchronous', 'normal'),  # Safe with WAL, only the last commits can be lost on power failure
+    ('cache_size', -16 * 1024),  # 16 MB page cache per connection
+    ('mmap_size', 64 * 1024 * 1024),
+    ('temp_store', 'memory'),
+    ('foreign_keys', 1)
+))
 
-fortnite_db = SqliteExtDatabase('data/fortnite.db')
+# Cogs that can be toggled per guild, each owns one bit of Guild.cogs. Only append to this!
+COGS = ('PARTYBUS', 'REDDIT', 'DISCORDBOTS')  # Not allowed to disable general or settings cogs
+ALL_COGS = (1 << len(COGS)) - 1
 
 
 class Database:
     def __init__(self, bot):
         self.bot = bot
         self.raw_db = fortnite_db
+        self.cache = LRUCache(self.bot.config.getint('database', 'cache_size', fallback=10000))
+        self.matchers = LRUCache(self.cache.maxsize)
         self.init()
 
     def init(self):
-        if 'guild' not in self.bot.db.get_tables():
+        tables = self.bot.db.get_tables()
+        if 'guild' not in tables:
             self.bot.logger.info('[Database] Created Guild table in database.')
             Guild.create_table()
+        elif 'settings' in [column.name for column in self.bot.db.get_columns('guild')]:
+            self.bot.logger.info('[Database] Migrating Guild settings out of JSON.')
+            migrate_settings()
+        if 'prefix' not in tables:
+            Prefix.create_table()
+        self.bot.loop.create_task(self.reconcile())
+
+    async def reconcile(self):
+        """Bring the Guild table in line with the guilds we are in, in a few bulk statements."""
+        guilds = {guild.id: guild.name for guild in self.bot.guilds}
+        inserted, deleted, renamed = await self.bot.db_executor.run(reconcile_guilds, guilds)
+        for guild_id in deleted:
+            self.cache.pop(guild_id)
+            self.matchers.pop(guild_id)
+        self.bot.logger.info(f'[Database] Reconciled guilds ({len(inserted)} added, {len(deleted)} removed, '
+                             f'{len(renamed)} renamed).')
+        await self.warm()
+
+    async def warm(self):
+        """Load the settings of the guilds we are currently in, up to the cache size."""
+        guild_ids = [guild.id for guild in self.bot.guilds][:self.cache.maxsize]
+        for batch in chunked(guild_ids, 500):  # Stay below SQLite's variable limit
+            for settings in await self.bot.db_executor.read(load_settings, batch):
+                self.cache.set(settings.id, settings)
+        self.bot.logger.info(f'[Database] Cached settings for {len(self.cache)} guilds.')
+
+    async def on_ready(self):
+        await self.reconcile()  # Catch up on guilds joined or left while disconnected
 
     async def on_guild_join(self, guild):
-        self.insert(guild.id)
+        await self.insert(guild.id)
 
     async def on_guild_remove(self, guild):
-        self.delete(guild.id)
+        await self.delete(guild.id)
 
-    def insert(self, guild_id: int):
+    async def insert(self, guild_id: int):
         """Insert a new Guild into the database."""
         guild = self.bot.get_guild(guild_id)
-        self.bot.logger.info(f'[Database] New Guild ({guild.name}) added to the database.')
-        return Guild.create(id=guild.id, name=guild.name)
+        guild, created = await self.bot.db_executor.run(Guild.get_or_create, id=guild.id,
+                                                        defaults={'name': guild.name})
+        if created:
+            self.bot.logger.info(f'[Database] New Guild ({guild.name}) added to the database.')
+        settings = GuildSettings(guild.id, [], guild.cogs, guild.subscribed)
+        self.cache.set(guild.id, settings)
+        return settings
 
-    def delete(self, guild_id: int):
-        """Remove a Guild from the database."""
-        try:
-            guild = Guild.get(Guild.id == guild_id)
-        except DoesNotExist:
-            guild = None
+    async def delete(self, guild_id: int):
+        """Remove a Guild (and its prefixes) from the database."""
+        self.cache.pop(guild_id)
+        self.matchers.pop(guild_id)
+        guild = await self.bot.db_executor.get(Guild, Guild.id == guild_id)
 
         if guild is not None:
             self.bot.logger.info(f'[Database] Guild ({guild.name}) was deleted from the database.')
-            guild.delete_instance()
-
-    def get(self, guild_id: int):
-        """Get a Guild database object,"""
-        try:
-            guild = Guild.get(Guild.id == guild_id)
-        except DoesNotExist:
-            guild = self.insert(guild_id)
-
-        return guild
-
-    def get_setting(self, guild_id: int, setting: str):
-        """Get the JSON data for a specific setting."""
-        try:
-            guild = Guild.get(Guild.id == guild_id)
-        except DoesNotExist:
-            guild = self.insert(guild_id)
-
-        settings = guild.settings
-        return settings[setting] if setting in settings else None
-
-    def set_setting(self, guild_id: int, setting: str, value):
-        try:
-            guild = Guild.get(Guild.id == guild_id)
-        except DoesNotExist:
-            guild = self.insert(guild_id)
-
-        settings = guild.settings
-        if setting in settings:
-            settings[setting] = value
-            guild.save()
-            return True
-        else:
-            return False
-
-    def get_cog(self, guild_id: int, cog: str):
-        cog = cog.upper()
-        try:
-            guild = Guild.get(Guild.id == guild_id)
-        except DoesNotExist:
-            guild = self.insert(guild_id)
-
-        cogs = guild.settings['cogs']
-        return cogs[cog] if cog in cogs else False  # Just return false if it somehow doesn't exist
-
-    def set_cog(self, guild_id: int, cog: str, value: bool):
-        cog = cog.upper()
-        try:
-            guild = Guild.get(Guild.id == guild_id)
-        except DoesNotExist:
-            guild = self.insert(guild_id)
-        cogs = guild.settings['cogs']
-        if cog in cogs:
-            cogs[cog] = value
-            guild.save()
-            return True
-        guild.save()
-        return False  # Failed to set value, cog DNE or cannot be changed
-
-    def reset(self, guild_id: int):
-        try:
-            guild = Guild.get(Guild.id == guild_id)
-        except DoesNotExist:
-            guild = self.insert(guild_id)
-        guild.settings = default_settings()
-        guild.save()
+            await self.bot.db_executor.delete(guild)
+
+    async def get(self, guild_id: int):
+        """Get the GuildSettings of a Guild, from the cache when possible."""
+        settings = self.cache.get(guild_id)
+        if settings is not None:
+            return settings
+
+        settings = await self.bot.db_executor.read(load_settings, [guild_id])
+        if not settings:
+            return await self.insert(guild_id)
+
+        self.cache.set(guild_id, settings[0])
+        return settings[0]
+
+    async def get_prefixes(self, guild_id: int):
+        """Get the prefixes of a Guild, the default prefix if none were set."""
+        settings = await self.get(guild_id)
+        return list(settings.prefixes) or [self.bot.prefix]
+
+    async def set_prefixes(self, guild_id: int, prefixes: list):
+        """Replace the prefixes of a Guild. An empty list restores the default prefix."""
+        settings = await self.get(guild_id)
+        await self.bot.db_executor.run(replace_prefixes, guild_id, prefixes)
+        settings.prefixes = list(prefixes)
+        self.matchers.pop(guild_id)
         return True
 
+    async def get_cog(self, guild_id: int, cog: str):
+        bit = cog_bit(cog)
+        if bit is None:
+            return False  # Just return false if it somehow doesn't exist
+        settings = await self.get(guild_id)
+        return bool(settings.cogs & bit)
+
+    async def set_cog(self, guild_id: int, cog: str, value: bool):
+        bit = cog_bit(cog)
+        if bit is None:
+            return False  # Failed to set value, cog DNE or cannot be changed
+        settings = await self.get(guild_id)
+        cogs = settings.cogs | bit if value else settings.cogs & ~bit
+        await self.bot.db_executor.execute(Guild.update(cogs=cogs).where(Guild.id == guild_id))
+        settings.cogs = cogs
+        return True
+
+    async def get_subscribed(self, guild_id: int):
+        settings = await self.get(guild_id)
+        return settings.subscribed
+
+    async def set_subscribed(self, guild_id: int, value: bool):
+        settings = await self.get(guild_id)
+        await self.bot.db_executor.execute(Guild.update(subscribed=value).where(Guild.id == guild_id))
+        settings.subscribed = value
+        return True
+
+    async def subscribed_guilds(self):
+        """Get the ids of every subscribed Guild."""
+        query = Guild.select(Guild.id).where(Guild.subscribed == True).tuples()
+        return [guild_id for guild_id, in await self.bot.db_executor.fetch(query)]
+
+    async def reset(self, guild_id: int):
+        settings = await self.get(guild_id)
+        await self.bot.db_executor.run(reset_guild, guild_id)
+        settings.prefixes, settings.cogs, settings.subscribed = [], ALL_COGS, True
+        self.matchers.pop(guild_id)
+        return True
+
+    async def prefix_matcher(self, guild_id: int):
+        """Get the compiled prefix matcher of a Guild, rebuilt only when its prefixes change."""
+        matcher = self.matchers.get(guild_id)
+        if matcher is None:
+            matcher = PrefixMatcher(await self.get_prefixes(guild_id), self.bot.user.id)
+            self.matchers.set(guild_id, matcher)
+        return matcher
+
 
-def default_settings():
-    """Generate the default settings for a Guild"""
-    return {'prefix': '.',
-            'cogs': {
-                'PARTYBUS': True,
-                'REDDIT': True,
-                'DISCORDBOTS': True
-            },  # Not allowed to disable general or settings cogs
-            'subscribed': True
-            }
+class GuildSettings:
+    """The cached settings of a Guild."""
+    __slots__ = ('id', 'prefixes', 'cogs', 'subscribed')
+
+    def __init__(self, guild_id: int, prefixes: list, cogs: int, subscribed: bool):
+        self.id = guild_id
+        self.prefixes = prefixes
+        self.cogs = cogs
+        self.subscribed = subscribed
+
+
+def cog_bit(cog: str):
+    """Get the bit of a cog in Guild.cogs, None if the cog cannot be toggled."""
+    cog = cog.upper()
+    return 1 << COGS.index(cog) if cog in COGS else None
+
+
+def load_settings(guild_ids: list):
+    """Load the GuildSettings of multiple guilds in two queries."""
+    settings = {guild_id: GuildSettings(guild_id, [], cogs, subscribed) for guild_id, cogs, subscribed in
+                Guild.select(Guild.id, Guild.cogs, Guild.subscribed).where(Guild.id.in_(guild_ids)).tuples()}
+    query = Prefix.select(Prefix.guild, Prefix.prefix).where(Prefix.guild.in_(list(settings))).order_by(Prefix.id)
+    for guild_id, prefix in query.tuples():
+        settings[guild_id].prefixes.append(prefix)
+    return list(settings.values())
+
+
+def replace_prefixes(guild_id: int, prefixes: list):
+    with fortnite_db.atomic():
+        Prefix.delete().where(Prefix.guild == guild_id).execute()
+        if prefixes:
+            Prefix.insert_many([{'guild': guild_id, 'prefix': prefix} for prefix in dict.fromkeys(prefixes)]).execute()
+
+
+def reset_guild(guild_id: int):
+    with fortnite_db.atomic():
+        Prefix.delete().where(Prefix.guild == guild_id).execute()
+        Guild.update(cogs=ALL_COGS, subscribed=True).where(Guild.id == guild_id).execute()
+
+
+def reconcile_guilds(guilds: dict):
+    """Insert missing, delete stale and rename changed Guild rows. Returns the affected ids."""
+    stored = dict(Guild.select(Guild.id, Guild.name).tuples())
+    inserted = [guild_id for guild_id in guilds if guild_id not in stored]
+    deleted = [guild_id for guild_id in stored if guild_id not in guilds]
+    renamed = [guild_id for guild_id, name in guilds.items() if guild_id in stored and stored[guild_id] != name]
+
+    with fortnite_db.atomic():
+        rows = [{'id': guild_id, 'name': guilds[guild_id], 'cogs': ALL_COGS, 'subscribed': True}
+                for guild_id in inserted]
+        for batch in chunked(rows, 200):  # 4 variables per row, SQLite allows 999
+            Guild.insert_many(batch).execute()
+        for batch in chunked(deleted, 500):
+            Guild.delete().where(Guild.id.in_(batch)).execute()  # Prefixes cascade
+        for guild_id in renamed:
+            Guild.update(name=guilds[guild_id]).where(Guild.id == guild_id).execute()
+
+    return inserted, deleted, renamed
+
+
+def migrate_settings():
+    """Move the old JSON Guild.settings into the cogs/subscribed columns and Prefix rows."""
+    rows = fortnite_db.execute_sql('SELECT id, settings FROM guild').fetchall()
+    migrator = SqliteMigrator(fortnite_db)
+    with fortnite_db.atomic():
+        migrate(
+            migrator.add_column('guild', 'cogs', IntegerField(default=ALL_COGS)),
+            migrator.add_column('guild', 'subscribed', BooleanField(default=True)),
+            migrator.drop_column('guild', 'settings'),
+            migrator.add_index('guild', ('subscribed',), False)
+        )
+        Prefix.create_table()
+
+        prefixes = []
+        for guild_id, settings in rows:
+            settings = json.loads(settings) if settings else {}
+            cogs = settings.get('cogs', {})
+            mask = sum(1 << i for i, cog in enumerate(COGS) if cogs.get(cog, True))
+            Guild.update(cogs=mask, subscribed=settings.get('subscribed', True)).where(Guild.id == guild_id).execute()
+            # Removing a prefix used to be a string replace, which could leave duplicates behind
+            unique = dict.fromkeys(split_prefixes(settings.get('prefix', '')))
+            prefixes += [{'guild': guild_id, 'prefix': prefix} for prefix in unique]
+        for batch in chunked(prefixes, 400):
+            Prefix.insert_many(batch).execute()
 
 
 class BaseModel(Model):
@@ -125,7 +261,16 @@ class BaseModel(Model):
 class Guild(BaseModel):
     id = IntegerField(unique=True, primary_key=True)
     name = CharField()
-    settings = JSONField(default=default_settings)
+    cogs = IntegerField(default=ALL_COGS)  # Bitmask over COGS
+    subscribed = BooleanField(default=True, index=True)
+
+
+class Prefix(BaseModel):
+    guild = ForeignKeyField(Guild, backref='prefixes', on_delete='CASCADE')
+    prefix = CharField()
+
+    class Meta:
+        indexes = ((('guild', 'prefix'), True),)
 
 
 def setup(bot):
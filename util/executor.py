@@ -0,0 +1,102 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DatabaseExecutor:
+    """Awaitable access to the peewee models.
+
+    Every query runs off the event loop so a slow disk never stalls the gateway heartbeats
+    of every shard. Writes are serialized on a single database thread, reads use a small
+    pool of their own so they never queue behind a write.
+    """
+
+    def __init__(self, loop=None, readers: int = 2):
+        self.loop = loop or asyncio.get_event_loop()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+        self.reader = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='database-read')
+        self.pending = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking database function on the database thread."""
+        return await self._submit(self.writer, func, *args, **kwargs)
+
+    async def read(self, func, *args, **kwargs):
+        """Run a blocking read-only database function on a reader thread."""
+        return await self._submit(self.reader, func, *args, **kwargs)
+
+    async def _submit(self, executor, func, *args, **kwargs):
+        queued = time.perf_counter()
+        started = []
+
+        def call():
+            started.append(time.perf_counter())
+            return func(*args, **kwargs)
+
+        self.pending += 1
+        try:
+            return await self.loop.run_in_executor(executor, call)
+        finally:
+            self.pending -= 1
+            self._record(queued, started)
+
+    def _record(self, queued: float, started: list):
+        latency = time.perf_counter() - queued
+        self.completed += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        if started:
+            self.total_wait += started[0] - queued
+
+    async def get(self, model, *query):
+        """Get a single model instance, or None if it does not exist."""
+        return await self.read(_get, model, query)
+
+    async def fetch(self, query):
+        """Execute a select query and return all of its rows."""
+        return await self.read(list, query)
+
+    async def execute(self, query):
+        """Execute an insert, update or delete query."""
+        return await self.run(query.execute)
+
+    async def save(self, instance):
+        return await self.run(instance.save)
+
+    async def delete(self, instance):
+        return await self.run(instance.delete_instance)
+
+    async def upsert(self, model, where, **fields):
+        """Update the rows matching where, creating one with fields if there are none."""
+        return await self.run(_upsert, model, where, fields)
+
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            'pending': self.pending,
+            'completed': self.completed,
+            'avg_wait': self.total_wait / completed * 1000,
+            'avg_latency': self.total_latency / completed * 1000,
+            'max_latency': self.max_latency * 1000
+        }
+
+    def shutdown(self):
+        self.reader.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+
+
+def _get(model, query):
+    try:
+        return model.get(*query)
+    except model.DoesNotExist:
+        return None
+
+
+def _upsert(model, where, fields):
+    with model._meta.database.atomic():
+        if not model.update(**fields).where(where).execute():
+            model.create(**fields)
@@ -0,0 +1,162 @@
+import asyncio
+import codecs
+import json
+from urllib.parse import urlparse
+
+import aiohttp
+
+from util.cache import SingleFlight
+from util.ratelimit import INTERACTIVE
+
+
+class HTTPClient:
+    """The bot's shared outbound HTTP client.
+
+    One aiohttp session is kept for the lifetime of the bot so connections are pooled
+    and kept alive, DNS lookups are cached, and every request has a default timeout.
+    Concurrent GETs of the same document at the same priority are coalesced into one request,
+    an interactive caller never joins a background request and waits at its priority. Hosts
+    with a RateLimiter registered in limiters are only requested through it.
+    """
+
+    def __init__(self, *, limit: int = 100, limit_per_host: int = 10, dns_ttl: int = 300, timeout: float = 10.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+        self.flights = SingleFlight()
+        self.limiters = {}  # Host -> RateLimiter
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=self.dns_ttl, use_dns_cache=True)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def start(self):
+        """Open the session ahead of the first request."""
+        return self.session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def get(self, url: str, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.session.post(url, **kwargs)
+
+    async def get_json(self, url: str, *, priority: int = INTERACTIVE, **kwargs):
+        """GET a JSON document, None if the request failed. Callers share the parsed document."""
+        fetch = lambda: self._get_json(url, **kwargs)
+        return await self.flights.do(('json', url, priority), lambda: self._schedule(url, fetch, priority))
+
+    async def get_json_status(self, url: str, *, priority: int = INTERACTIVE, **kwargs):
+        """GET a JSON document as (status, document), the status is None if the request failed."""
+        fetch = lambda: self._get_json_status(url, **kwargs)
+        return await self.flights.do(('json_status', url, priority), lambda: self._schedule(url, fetch, priority))
+
+    async def get_json_first(self, url: str, *, priority: int = INTERACTIVE, **kwargs):
+        """GET only the first element of a JSON array, None if the request failed or the array is empty.
+
+        The body is read until the first element is complete and the rest is never downloaded
+        or decoded, so the cost does not grow with the length of the array.
+        """
+        fetch = lambda: self._get_json_first(url, **kwargs)
+        return await self.flights.do(('json_first', url, priority), lambda: self._schedule(url, fetch, priority))
+
+    async def get_text(self, url: str, *, priority: int = INTERACTIVE, **kwargs):
+        """GET a text document, None if the request failed."""
+        fetch = lambda: self._get_text(url, **kwargs)
+        return await self.flights.do(('text', url, priority), lambda: self._schedule(url, fetch, priority))
+
+    async def get_status(self, url: str, *, priority: int = INTERACTIVE, **kwargs):
+        """GET a URL for its status code only, None if the request failed."""
+        return await self._schedule(url, lambda: self._get_status(url, **kwargs), priority)
+
+    async def _schedule(self, url: str, fetch, priority: int):
+        limiter = self.limiters.get(urlparse(url).hostname)
+        if limiter is None:
+            return await fetch()
+        return await limiter.run(fetch, priority)
+
+    async def _get_json(self, url: str, **kwargs):
+        try:
+            async with self.get(url, **kwargs) as r:
+                return await r.json() if r.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def _get_json_status(self, url: str, **kwargs):
+        try:
+            async with self.get(url, **kwargs) as r:
+                return r.status, await r.json() if r.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None, None
+
+    async def _get_json_first(self, url: str, **kwargs):
+        try:
+            async with self.get(url, **kwargs) as r:
+                if r.status != 200:
+                    return None
+                decoder = codecs.getincrementaldecoder(r.get_encoding())()
+                buffer = ''
+                async for chunk in r.content.iter_chunked(4096):
+                    buffer += decoder.decode(chunk)
+                    found, element = decode_first(buffer)
+                    if found:
+                        return element
+                return decode_first(buffer + decoder.decode(b'', final=True))[1]
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def _get_status(self, url: str, **kwargs):
+        try:
+            async with self.get(url, **kwargs) as r:
+                return r.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def _get_text(self, url: str, **kwargs):
+        try:
+            async with self.get(url, **kwargs) as r:
+                return await r.text() if r.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+
+_decoder = json.JSONDecoder()
+
+
+def decode_first(text: str):
+    """Decode the first element of a possibly incomplete JSON array as (found, element).
+
+    found is False while more text is needed. Anything but a non-empty array is (True, None).
+    """
+    index = _skip_whitespace(text, 0)
+    if index == len(text):
+        return False, None
+    if text[index] != '[':
+        return True, None
+    index = _skip_whitespace(text, index + 1)
+    if index == len(text):
+        return False, None
+    if text[index] == ']':
+        return True, None
+    try:
+        element, end = _decoder.raw_decode(text, index)
+    except json.JSONDecodeError:
+        return False, None
+    # A number may continue in the next chunk, the element is complete once something follows it
+    return (True, element) if end < len(text) else (False, None)
+
+
+def _skip_whitespace(text: str, index: int) -> int:
+    while index < len(text) and text[index].isspace():
+        index += 1
+    return index
@@ -0,0 +1,37 @@
+import bisect
+
+
+class Leaderboard:
+    """Players ranked by several metrics at once.
+
+    Every metric keeps a sorted index of (-value, key) so a ranking is read in order
+    without sorting, and updating a player only moves their entry in each index.
+    """
+
+    def __init__(self, metrics):
+        self.values = {}  # Key -> {metric: value}
+        self.indexes = {metric: [] for metric in metrics}
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def update(self, key, values: dict):
+        self.remove(key)
+        for metric, index in self.indexes.items():
+            bisect.insort(index, (-values[metric], key))
+        self.values[key] = values
+
+    def remove(self, key):
+        old = self.values.pop(key, None)
+        if old is None:
+            return
+        for metric, index in self.indexes.items():
+            del index[bisect.bisect_left(index, (-old[metric], key))]
+
+    def ranked(self, metric: str):
+        """Iterate over (key, values) from best to worst by a metric."""
+        for _, key in self.indexes[metric]:
+            yield key, self.values[key]
@@ -0,0 +1,53 @@
+from collections import Counter
+
+
+def trigrams(name: str) -> set:
+    padded = '  ' + name.lower() + ' '  # Pad so the start of a name weighs more than its end
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Fuzzy matching of known player names by the trigrams they share.
+
+    Names are scored by the Jaccard similarity of their trigram sets, so suggestions for a
+    typo come from memory without asking upstream.
+    """
+
+    def __init__(self, *, min_score: float = 0.25):
+        self.min_score = min_score
+        self.names = {}  # Lowercase name -> display name
+        self.sizes = {}  # Lowercase name -> number of trigrams
+        self.index = {}  # Trigram -> lowercase names
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name: str):
+        return name.lower() in self.names
+
+    def add(self, name: str):
+        key = name.lower()
+        if key in self.names:
+            if self.names[key] == key:
+                self.names[key] = name  # Prefer a display name over a lowercase one
+            return
+        grams = trigrams(key)
+        self.names[key] = name
+        self.sizes[key] = len(grams)
+        for gram in grams:
+            self.index.setdefault(gram, set()).add(key)
+
+    def suggest(self, name: str, limit: int = 3) -> list:
+        """The display names most similar to a name, best first."""
+        grams = trigrams(name)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.index.get(gram, ()))
+
+        scored = []
+        for key, count in shared.items():
+            score = count / (len(grams) + self.sizes[key] - count)
+            if score >= self.min_score:
+                scored.append((score, key))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self.names[key] for _, key in scored[:limit]]
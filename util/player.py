@@ -0,0 +1,83 @@
+SOLO, DUO, SQUAD = 2, 10, 9  # PartyBus playlist ids
+MODES = {SOLO: 'Solo', DUO: 'Duo', SQUAD: 'Squad'}
+
+
+class ModeStats:
+    """Lifetime stats of a player in one mode, or over all of them."""
+    __slots__ = ('games', 'kills', 'wins', 'place_b', 'place_c', 'minutes')
+
+    def __init__(self, games: int = 0, kills: int = 0, wins: int = 0, place_b: int = 0, place_c: int = 0,
+                 minutes: int = 0):
+        self.games = games
+        self.kills = kills
+        self.wins = wins
+        self.place_b = place_b  # Top 10 solo, top 5 duo, top 3 squad
+        self.place_c = place_c  # Top 25 solo, top 12 duo, top 6 squad
+        self.minutes = minutes
+
+    @classmethod
+    def from_json(cls, stat: dict):
+        return cls(stat['games'], stat['kills'], stat['placeA'], stat['placeB'], stat['placeC'], int(stat['minutes']))
+
+    def add(self, other):
+        self.games += other.games
+        self.kills += other.kills
+        self.wins += other.wins
+        self.place_b += other.place_b
+        self.place_c += other.place_c
+        self.minutes += other.minutes
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.games * 100 if self.games else 0.0
+
+    @property
+    def kill_rate(self) -> float:
+        return self.kills / self.games if self.games else 0.0
+
+    @property
+    def kd_ratio(self) -> float:
+        deaths = self.games - self.wins
+        return self.kills / deaths if deaths else float(self.kills)
+
+    @property
+    def playtime(self) -> str:
+        hours, minutes = divmod(self.minutes, 60)
+        days, hours = divmod(hours, 24)
+        return f'{days}D {hours}H {minutes}M'
+
+    def totals(self) -> tuple:
+        return self.games, self.kills, self.wins, self.place_b, self.place_c, self.minutes
+
+
+class PlayerStats:
+    """A PartyBus player document parsed once into per mode and overall stats."""
+    __slots__ = ('name', 'platform', 'modes', 'overall')
+
+    def __init__(self, name: str, platform: str, modes: dict, overall: ModeStats):
+        self.name = name
+        self.platform = platform
+        self.modes = modes  # Playlist id -> ModeStats
+        self.overall = overall
+
+    @classmethod
+    def parse(cls, js: dict):
+        modes, overall = {}, ModeStats()
+        for stat in js['stats']:
+            mode = ModeStats.from_json(stat)
+            modes.setdefault(stat['p'], mode)
+            overall.add(mode)
+        platform = js['stats'][0]['platform'] if js['stats'] else None
+        return cls(js['details']['displayName'], platform, modes, overall)
+
+    @property
+    def solo(self):
+        return self.modes.get(SOLO)
+
+    @property
+    def duo(self):
+        return self.modes.get(DUO)
+
+    @property
+    def squad(self):
+        return self.modes.get(SQUAD)
@@ -0,0 +1,28 @@
+class PrefixMatcher:
+    """Precompiled set of command prefixes for a guild, including the bot mentions.
+
+    Messages that cannot start with any prefix are rejected on their first character,
+    which is the case for nearly every message the bot sees.
+    """
+    __slots__ = ('prefixes', 'first_chars')
+
+    def __init__(self, prefixes, user_id: int):
+        mentions = [f'<@{user_id}> ', f'<@!{user_id}> ']
+        # Longest first so that a prefix is never shadowed by one of its own prefixes ('!' and '!!')
+        prefixes = sorted({prefix for prefix in prefixes if prefix}, key=len, reverse=True)
+        self.prefixes = tuple(mentions + prefixes)
+        self.first_chars = frozenset(prefix[0] for prefix in self.prefixes)
+
+    def match(self, content: str):
+        """Return the prefix the content starts with, or None."""
+        if not content or content[0] not in self.first_chars:
+            return None
+        for prefix in self.prefixes:
+            if content.startswith(prefix):
+                return prefix
+        return None
+
+
+def split_prefixes(setting: str):
+    """Split the '|' delimited prefix setting into its prefixes."""
+    return [prefix for prefix in setting.split('|') if prefix]
@@ -0,0 +1,105 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+INTERACTIVE = 0  # Someone is waiting on the reply of a command
+BACKGROUND = 1  # Refreshes and other scheduled work
+
+
+class Busy(Exception):
+    """Raised when a request could not be scheduled before its deadline."""
+    pass
+
+
+class RateLimiter:
+    """Client-side scheduler for an upstream API.
+
+    Requests wait in a priority queue (interactive before background) and are let through
+    by a token bucket of rate requests per second, at most concurrency at a time. A request
+    still queued after its timeout is rejected with Busy instead of joining a backlog.
+    """
+
+    def __init__(self, *, rate: float, burst: int, concurrency: int, timeout: float, max_queue: int = 500):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.scheduled = self.rejected = 0
+        self.total_wait = 0.0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._active = 0
+        self._queue = []  # Heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._timer = None
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    async def run(self, fetch, priority: int = INTERACTIVE, timeout: float = None):
+        """Await fetch() once the scheduler lets it through."""
+        await self.acquire(priority, timeout)
+        try:
+            return await fetch()
+        finally:
+            self.release()
+
+    async def acquire(self, priority: int = INTERACTIVE, timeout: float = None):
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            raise Busy('Too many queued requests')
+
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future))
+        queued = time.monotonic()
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.timeout if timeout is None else timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                self.release()  # Let through at the last moment, hand the slot back
+            else:
+                future.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            raise Busy('Request deadline passed while queued') from None
+
+        self.scheduled += 1
+        self.total_wait += time.monotonic() - queued
+
+    def release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _dispatch(self):
+        self._refill()
+        while self._queue and self._active < self.concurrency:
+            if self._queue[0][2].done():  # Timed out or cancelled while queued
+                heapq.heappop(self._queue)
+                continue
+            if self._tokens < 1:
+                if self._timer is None:
+                    self._timer = asyncio.get_event_loop().call_later((1 - self._tokens) / self.rate, self._wake)
+                return
+            _, _, future = heapq.heappop(self._queue)
+            self._tokens -= 1
+            self._active += 1
+            future.set_result(None)
+
+    def _wake(self):
+        self._timer = None
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {'queued': self.queued, 'active': self._active, 'scheduled': self.scheduled,
+                'rejected': self.rejected, 'avg_wait': self.total_wait / (self.scheduled or 1) * 1000}
@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from util.cache import LRUCache
+
+# Text anchors on the stats card template, the text is centered on them
+LAYOUT = {
+    'name': (427, 90),
+    'solo': (277, 323),
+    'duo': (659, 323),
+    'squad': (1042, 323)
+}
+
+# Loaded once per worker process, when it starts
+_template = None
+_font = None
+
+
+def _load(template_path: str, font_path: str):
+    global _template, _font
+    from PIL import Image, ImageFont
+
+    _template = Image.open(template_path)
+    _template.load()
+    _font = ImageFont.truetype(font_path, 24)
+
+
+def render_card(card: dict) -> bytes:
+    """Draw the texts of a card onto the template and return it as PNG bytes. Runs in a worker."""
+    from PIL import ImageDraw
+
+    image = _template.copy()
+    draw = ImageDraw.Draw(image)
+    for key, text in card.items():
+        x, y = LAYOUT[key]
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=_font)  # Ink box, without the Y padding
+        draw.text((x - (left + right) / 2, y - (top + bottom) / 2), text, font=_font)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class CardRenderer:
+    """Renders stats cards in a process pool so drawing never blocks the event loop.
+
+    Rendered cards are cached by a hash of their texts.
+    """
+
+    def __init__(self, template_path: str, font_path: str, *, workers: int = 2, cache_size: int = 256):
+        # Spawned rather than forked, the bot process runs database and resolver threads
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_load, initargs=(template_path, font_path))
+        self.cache = LRUCache(cache_size)
+
+    async def render(self, card: dict) -> bytes:
+        key = hashlib.sha1(repr(sorted(card.items())).encode()).digest()
+        png = self.cache.get(key)
+        if png is None:
+            loop = asyncio.get_event_loop()
+            png = await loop.run_in_executor(self.pool, render_card, card)
+            self.cache.set(key, png)
+        return png
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
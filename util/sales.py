@@ -0,0 +1,103 @@
+import re
+from datetime import datetime
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from util.cache import SingleFlight
+from util.ratelimit import BACKGROUND
+
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+SALES_URL = 'https://stormshield.one/pvp/sales'
+
+# Only the sale sections become tags, the rest of the page is skipped by the parser
+SECTIONS = SoupStrainer(class_=re.compile(r'\bsale__items\b'))
+# The headings and sale sections of the page in order, a section's title is the heading before it
+HEADINGS = re.compile(r'<h2[^>]*>\s*([^<]*?)\s*</h2>|<div[^>]*class="[^"]*\bsale__items\b')
+PRICE = re.compile(r'\((\d+)v\)')
+
+
+class SaleItem:
+    __slots__ = ('name', 'price', 'image')
+
+    def __init__(self, name: str, price: int, image: str):
+        self.name = name
+        self.price = price  # V-Bucks
+        self.image = image
+
+
+class Sale:
+    """One section of the item shop, its title is the date of a daily sale."""
+    __slots__ = ('title', 'items')
+
+    def __init__(self, title: str, items: tuple):
+        self.title = title
+        self.items = items
+
+
+class SalesCatalog:
+    """The item shop, scraped on a schedule and parsed once into the daily and weekly sales.
+
+    Commands read the parsed sales from memory. The page is parsed in a worker thread so the
+    event loop never waits on the HTML parser.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.sales = {}  # 'daily'/'weekly' -> Sale
+        self.updated = None
+        self.flights = SingleFlight()
+
+    async def get(self, section: str):
+        """Get a section of the shop, scraping it first if it was never loaded. None if unavailable."""
+        if not self.sales:
+            await self.refresh()
+        return self.sales.get(section)
+
+    async def refresh(self):
+        """Scrape and parse the shop, keeping the last catalog if the page could not be read."""
+        await self.flights.do('sales', self._refresh)
+
+    async def _refresh(self):
+        html = await self.bot.web.get_text(SALES_URL, priority=BACKGROUND)
+        if html is None:
+            return
+        try:
+            sales = await self.bot.loop.run_in_executor(None, parse_sales, html)
+        except (AttributeError, IndexError, KeyError, ValueError) as e:
+            self.bot.logger.info(f'[Sales] Could not parse the item shop: {e!r}')
+            return
+        self.sales = sales
+        self.updated = datetime.utcnow()
+
+
+def parse_sales(html: str) -> dict:
+    titles, heading = [], None
+    for match in HEADINGS.finditer(html):
+        if match.group(1) is not None:
+            heading = match.group(1)
+        else:
+            titles.append(heading)
+    if len(titles) < 2 or titles[1] is None:
+        raise ValueError('The daily sale has no heading')
+    weekly, daily = BeautifulSoup(html, PARSER, parse_only=SECTIONS).find_all(class_='sale__items', limit=2)
+
+    date = datetime.strptime(titles[1] + ' ' + str(datetime.utcnow().year), '%d %b %Y').strftime('%B %d, %Y')
+    return {
+        'daily': Sale(date, parse_items(daily, daily.find_all('img', class_='col'))),
+        'weekly': Sale('Weekly Sale', parse_items(weekly, weekly.find_all('img')))
+    }
+
+
+def parse_items(sale, images) -> tuple:
+    items = []
+    for strong, image in zip(sale.find_all('strong'), images):
+        title = strong.parent.text.replace('\n', ' ').strip()
+        match = PRICE.search(title)
+        items.append(SaleItem(title.replace(match.group(0), '').strip(), int(match.group(1)),
+                              'https://stormshield.one' + image['src']))
+    return tuple(items)